@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'predictor.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -93,6 +95,68 @@ DATABASES = {
     'default' : dj_database_url.parse(os.environ.get('DATABASE_URL'))
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Forecasts live in process memory unless FORECAST_CACHE_DIR points to a
+# directory, which lets the workers of a host share them.
+FORECAST_CACHE_DIR = os.environ.get('FORECAST_CACHE_DIR')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'forecasts': {
+        'BACKEND': 'predictor.cache.DiskLRUCache' if FORECAST_CACHE_DIR else 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': FORECAST_CACHE_DIR or 'forecasts',
+        'TIMEOUT': 6 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500,
+        },
+    },
+}
+
+# Model registry
+# Fitted models are pickled into MODEL_REGISTRY_DIR and reused while their
+# training data is unchanged. Past MODEL_REGISTRY_MAX_BYTES the least
+# recently used ones are deleted, except the latest pooled model.
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', os.path.join(tempfile.gettempdir(), 'aqi-models'))
+MODEL_REGISTRY_MAX_BYTES = int(os.environ.get('MODEL_REGISTRY_MAX_BYTES', 256 * 1024 * 1024))
+
+# Stage timing
+# Durations of the forecast stages are sent in a Server-Timing header and
+# exported at /metrics/. STAGE_TIMING=off disables it.
+STAGE_TIMING = os.environ.get('STAGE_TIMING', 'on') != 'off'
+
+# Training history
+# Forecasters are fitted on the history TRAINING_LOOKBACK keeps: full (the
+# default), window, seasons or downsample, see predictor.preprocess.bound.
+# The shorter policies fit faster, backtest them on real stations before
+# using one (manage.py backtest --lookback). With TRAINING_MEMORY_BYTES set,
+# a request fits on no more rows than that pays for.
+TRAINING_LOOKBACK = os.environ.get('TRAINING_LOOKBACK', 'full')
+TRAINING_MEMORY_BYTES = int(os.environ.get('TRAINING_MEMORY_BYTES', 0))
+
+# Upstream rate limit
+# 1000 calls per second is the limit allowed by the WAQI API. The workers of
+# a host share it through a token bucket in UPSTREAM_LIMITER_PATH, and back
+# off together when they are throttled. UPSTREAM_RATE=0 disables it.
+UPSTREAM_RATE = float(os.environ.get('UPSTREAM_RATE', 1000))
+UPSTREAM_LIMITER_PATH = os.environ.get('UPSTREAM_LIMITER_PATH', os.path.join(tempfile.gettempdir(), 'aqi-upstream.sqlite3'))
+
+# API keys
+# Scripts and dashboards call the JSON endpoints (batch/ and jobs/) with an
+# X-API-Key header holding one of API_KEYS, comma separated, instead of the
+# CSRF cookie and token the pages of the site send. The status and result of
+# a job (jobs/<id>/) are not checked, its random ID is the only credential.
+API_KEYS = [key for key in os.environ.get('API_KEYS', '').split(',') if key]
+
+# Current readings
+# Today's readings of a station, at /current/ or with mode=current, skip the
+# forecast. They are cached for CURRENT_AQI_TTL seconds, WAQI updates its
+# feed about hourly.
+CURRENT_AQI_TTL = int(os.environ.get('CURRENT_AQI_TTL', 5 * 60))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
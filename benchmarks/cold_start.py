@@ -0,0 +1,84 @@
+"""Cold start benchmark: import time and time to the first response.
+
+Every run starts a fresh interpreter, imports the WSGI application like the
+serverless entry point does, then renders the index page once. Heavy modules
+that got imported along the way are listed, the forecasting stack should not
+be among them.
+
+Usage:
+    python benchmarks/cold_start.py [--runs 5] [--output cold_start.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Modules a page render should not need.
+HEAVY_MODULES = ["pandas", "numpy", "sktime", "prophet", "cmdstanpy", "js2py"]
+
+# Runs inside the fresh interpreter and prints its measurements as JSON.
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from aqi.wsgi import application
+imported = time.perf_counter()
+
+from wsgiref.util import setup_testing_defaults
+environ = {"PATH_INFO": "/", "REQUEST_METHOD": "GET"}
+setup_testing_defaults(environ)
+statuses = []
+body = b"".join(application(environ, lambda status, headers: statuses.append(status)))
+responded = time.perf_counter()
+
+print(json.dumps({
+    "import_seconds": imported - start,
+    "first_response_seconds": responded - start,
+    "status": statuses[0],
+    "bytes": len(body),
+    "heavy_modules": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    env.setdefault("DJANGO_SETTINGS_MODULE", "aqi.settings")
+    env.setdefault("DATABASE_URL", f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write the report to this JSON file.")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    report = {
+        "runs": args.runs,
+        "import_seconds": statistics.median(r["import_seconds"] for r in runs),
+        "first_response_seconds": statistics.median(r["first_response_seconds"] for r in runs),
+        "status": runs[-1]["status"],
+        "heavy_modules": sorted({m for r in runs for m in r["heavy_modules"]}),
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Upstream payloads the benchmarks replay.
+
+Fixtures live in benchmarks/fixtures: the raw event stream of a station in
+sse/<city_id>.txt and the response of a station search in
+search/<query>.json. They are recorded from the WAQI servers, or synthesized
+in the same wire format where there is no network.
+
+Usage:
+    python benchmarks/fixtures.py record delhi london
+    python benchmarks/fixtures.py synthesize
+"""
+import argparse
+import json
+import math
+import random
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+import requests
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+SEARCH_URL = "https://search.waqi.info/nsearch/station/{query}"
+SSE_URL = "https://api.waqi.info/api/attsse/{city_id}/yd.json"
+
+# Stations synthesized when nothing was recorded: query, city ID, years of history.
+SYNTHETIC_STATIONS = [("delhi", 900001, 3), ("london", 900002, 8)]
+
+# Species the backend sends for a typical station, with a mean daily level.
+SYNTHETIC_SPECIES = {"pm25": 150, "pm10": 90, "o3": 30, "no2": 20, "so2": 6, "co": 8}
+
+
+def slug(query: str) -> str:
+    """File name of the search fixture of query."""
+    return re.sub(r"\W+", "-", query.strip().lower()).strip("-")
+
+
+def sse_path(city_id: int) -> Path:
+    return FIXTURES_DIR / "sse" / f"{city_id}.txt"
+
+
+def search_path(query: str) -> Path:
+    return FIXTURES_DIR / "search" / f"{slug(query)}.json"
+
+
+def stations() -> List[int]:
+    """City IDs of the recorded event streams."""
+    return sorted(int(path.stem) for path in (FIXTURES_DIR / "sse").glob("*.txt"))
+
+
+def queries() -> List[str]:
+    """Slugs of the recorded searches."""
+    return sorted(path.stem for path in (FIXTURES_DIR / "search").glob("*.json"))
+
+
+def record(query: str) -> int:
+    """Record the search for query and the event stream of its first station.
+
+    Returns:
+        int: The city ID of the recorded station.
+    """
+    search = requests.get(SEARCH_URL.format(query=query), timeout=30)
+    search.raise_for_status()
+    results = search.json()["results"]
+    if not results:
+        raise Exception(f'No station found for "{query}".')
+
+    city_id = results[0]["x"]
+    stream = requests.get(SSE_URL.format(city_id=city_id), timeout=60)
+    stream.raise_for_status()
+
+    search_path(query).parent.mkdir(parents=True, exist_ok=True)
+    sse_path(city_id).parent.mkdir(parents=True, exist_ok=True)
+    search_path(query).write_text(json.dumps(search.json()))
+    sse_path(city_id).write_bytes(stream.content)
+    return city_id
+
+
+def _encode_series(values: List[int]) -> str:
+    """Encode daily integers in the compressed series format of the backend.
+
+    The inverse of predictor.decodedata.decode_series for whole numbers: one
+    delta per day, a letter for small deltas, "!n." otherwise and a count
+    in front of repeated deltas.
+    """
+    deltas = [value - previous for previous, value in zip([0] + values, values)]
+
+    out = []
+    i = 0
+    while i < len(deltas):
+        run = 1
+        while i + run < len(deltas) and deltas[i + run] == deltas[i]:
+            run += 1
+        delta = deltas[i]
+        if 0 <= delta <= 25:
+            code = chr(65 + delta)
+        elif -26 <= delta < 0:
+            code = chr(97 - delta - 1)
+        else:
+            code = f"!{delta}."
+        if run > 1 and not code.startswith("!"):
+            out.append(f"{run}{code}")
+        else:
+            out.append(code * run)
+        i += run
+    return "1" + "".join(out)
+
+
+def _synthetic_stream(city_id: int, years: int, rng: random.Random) -> str:
+    """Event stream of a station with years of daily history, a message per year."""
+    end = datetime(2023, 12, 31)
+    days = 365 * years
+    start = end - timedelta(days=days - 1)
+
+    levels = {}
+    for species, mean in SYNTHETIC_SPECIES.items():
+        level, series = mean, []
+        for day in range(days):
+            season = 0.3 * mean * math.cos(2 * math.pi * day / 365.25)
+            level += 0.2 * (mean + season - level) + rng.gauss(0, 0.1 * mean)
+            series.append(max(0, round(level)))
+        levels[species] = series
+
+    events = []
+    # The backend repeats the last day of every message in the next one.
+    for first in range(0, days, 365):
+        last = min(first + 366, days)
+        origin = start + timedelta(days=first - 1)
+        msg = {
+            "ps": {species: _encode_series(series[first:last]) for species, series in levels.items()},
+            "dh": 24,
+            "st": int((origin - datetime(1970, 1, 1)).total_seconds() // 3600),
+            "meta": {"si": {"name": f"Synthetic station {city_id}"}},
+            "period": "d",
+        }
+        events.append(f"event: msg\ndata: {json.dumps({'msg': msg})}\n\n")
+    events.append("event: done\ndata: \n\n")
+    return "".join(events)
+
+
+def synthesize(seed: int = 0) -> None:
+    """Write deterministic fixtures for SYNTHETIC_STATIONS."""
+    rng = random.Random(seed)
+    for query, city_id, years in SYNTHETIC_STATIONS:
+        search = {
+            "results": [
+                {
+                    "x": city_id,
+                    "c": "XX",
+                    "n": f"{query.title()} Synthetic, {query.title()}",
+                    "s": {"u": f"synthetic/{query}"},
+                    "score": 1000,
+                }
+            ]
+        }
+        search_path(query).parent.mkdir(parents=True, exist_ok=True)
+        sse_path(city_id).parent.mkdir(parents=True, exist_ok=True)
+        search_path(query).write_text(json.dumps(search))
+        sse_path(city_id).write_text(_synthetic_stream(city_id, years, rng))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="Record from the WAQI servers.")
+    record_parser.add_argument("queries", nargs="+", help="Cities to search for.")
+    commands.add_parser("synthesize", help="Generate offline fixtures.")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        for query in args.queries:
+            print(query, record(query))
+    else:
+        synthesize()
+        print(f"Wrote fixtures for {len(SYNTHETIC_STATIONS)} stations to {FIXTURES_DIR}")
+
+
+if __name__ == "__main__":
+    main()
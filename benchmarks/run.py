@@ -0,0 +1,305 @@
+"""Microbenchmarks of the forecast hot paths over the recorded fixtures.
+
+Runs offline: the WAQI endpoints are served by a local stub, see stub.py,
+and the database is an in-memory SQLite one. Results are printed and saved
+as JSON, and can be compared against a previous run to catch regressions.
+Before the decoder is timed, its output on every fixture message is checked
+against the js2py reference decoder.
+
+Usage:
+    python benchmarks/run.py [--quick] [--output results.json]
+    python benchmarks/run.py --compare baseline.json [--threshold 1.2]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+import fixtures
+from stub import WAQIStub
+
+# Horizons every engine is benchmarked with, in days.
+HORIZONS = [7, 30]
+
+# Runs that are this much slower than the baseline are regressions.
+THRESHOLD = 1.2
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Time fn, looping fast functions so that every sample takes 0.2 s or more.
+
+    Returns:
+        Dict[str, Any]: Seconds per call (min, median, mean, stdev) and the
+            number of calls per sample and of samples.
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def setup_django() -> None:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "aqi.settings")
+    os.environ.setdefault("DATABASE_URL", "sqlite://:memory:")
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command("migrate", verbosity=0)
+
+
+def reset_state() -> None:
+    """Forget stations, observations, fits, models and forecasts, like a fresh deployment.
+
+    The pooled model is kept, it is trained before a deployment serves.
+    """
+    from django.core.cache import caches
+
+    from predictor import cache, pooled, preprocess, registry, search
+    from predictor.models import ModelVersion, Observation, ProphetFit, Station
+
+    Observation.objects.all().delete()
+    ProphetFit.objects.all().delete()
+    Station.objects.all().delete()
+    models = ModelVersion.objects.exclude(station_id=pooled.STATION_ID)
+    for path in models.values_list("path", flat=True):
+        try:
+            os.remove(os.path.join(registry.REGISTRY_DIR, path))
+        except FileNotFoundError:
+            pass
+    models.delete()
+    with preprocess._cache_lock:
+        preprocess._cache.clear()
+    search.station_index.cache_clear()
+    caches[cache.FORECAST_CACHE].clear()
+
+
+def check_decoder(messages) -> None:
+    """Assert that the native decoder reads every message like the js2py reference does.
+
+    The reference gives integer columns where all readings are whole
+    numbers, so only the values and dates are compared, not the dtypes.
+    """
+    from pandas.testing import assert_frame_equal
+
+    from predictor import decodedata
+
+    for message in messages:
+        assert_frame_equal(
+            decodedata.parse_incoming_result(message),
+            decodedata.parse_incoming_result_js(message),
+            check_dtype=False,
+        )
+
+
+def run_suite(args) -> Dict[str, Dict[str, Any]]:
+    from django.http import JsonResponse
+
+    from predictor import data, decodedata, encoding, forecaster, preprocess, search, store
+
+    results = {}
+
+    def bench(name: str, fn: Callable[[], Any], repeat: int = args.repeat) -> None:
+        results[name] = measure(fn, repeat)
+        print(f"{name:<48} {results[name]['median'] * 1e3:>12.3f} ms", flush=True)
+
+    with WAQIStub() as stub, stub.offline():
+        for city_id in fixtures.stations():
+            messages = decodedata.get_results_from_backend(city_id)
+            # A faster decoder is only worth timing if it still decodes correctly.
+            check_decoder(messages)
+
+            bench(
+                f"decode/parse_incoming_result/{city_id}",
+                lambda: [decodedata.parse_incoming_result(m) for m in messages],
+            )
+            bench(f"ingest/get_data_from_id/{city_id}", lambda: decodedata.get_data_from_id(city_id))
+
+            buffers = {}
+            for message in messages:
+                for name, (dates, values) in decodedata.decode_message(message["msg"]).items():
+                    buffers.setdefault(name, decodedata._SeriesBuffer()).append(dates, values)
+            bench(f"ingest/assemble_frame/{city_id}", lambda: decodedata._assemble_frame(buffers))
+
+        for query in fixtures.queries():
+            candidates = json.loads(fixtures.search_path(query).read_text())["results"]
+            bench(f"search/parse_candidates/{query}", lambda: search.parse_candidates(candidates))
+
+        # The local store the pooled engine is trained on.
+        for city_id in fixtures.stations():
+            store.sync_station(city_id)
+
+        # Forecasts on the longest history.
+        city_id = fixtures.stations()[-1]
+        frame = decodedata.get_data_from_id(city_id).rename(columns={"pm25": "pm2.5"})
+        today = datetime.now().date()
+        bench(f"prepare/prepare/{city_id}", lambda: preprocess._prepare(frame, today))
+        dataset = preprocess.prepare(frame)
+
+        for engine in args.engines:
+            for horizon in args.horizons:
+                bench(
+                    f"forecast/{engine}/h{horizon}/{city_id}",
+                    lambda: forecaster.sktime_forecast(
+                        dataset=dataset,
+                        horizon=horizon,
+                        forecaster=forecaster.ENGINES[engine](),
+                        executor=args.executor,
+                        warm_start=False,
+                    ),
+                    repeat=args.forecast_repeat,
+                )
+
+        # Result assembly and serialization of a 30 day forecast.
+        predicted_data = forecaster.sktime_forecast(
+            dataset=dataset,
+            horizon=30,
+            forecaster=forecaster.ENGINES[args.engines[0]](),
+            executor=args.executor,
+            warm_start=False,
+        )
+        dates = forecaster._forecast_dates(30, "D")
+        values = {col: [day[col] for day in predicted_data.values()] for col in dataset.columns}
+        bench("assemble/result", lambda: forecaster._predicted_data(dates, values))
+
+        out = {
+            "code": 200,
+            "response": {
+                "predicted_data": predicted_data,
+                "presentDayData": dataset.present_day,
+                "city_name": "benchmark",
+                "city_station": "benchmark",
+                "country_code": "XX",
+            },
+        }
+        bench("serialize/JsonResponse", lambda: JsonResponse(out).content)
+
+        # The columnar layout getForecastData caches, and its response.
+        forecast = forecaster.sktime_forecast(
+            dataset=dataset,
+            horizon=30,
+            forecaster=forecaster.ENGINES[args.engines[0]](),
+            executor=args.executor,
+            warm_start=False,
+            columnar=True,
+        )
+        bench("assemble/nested_from_columnar", lambda: forecaster._nested_data(forecast))
+        columnar = {"code": 200, "response": {"format": "columnar", "dates": forecast["dates"], "values": forecast["values"]}}
+        bench("serialize/columnar", lambda: encoding.dumps(columnar))
+
+        # A forecast request for a city nobody asked for before, end to end.
+        query = fixtures.queries()[0]
+        for engine in args.engines:
+
+            def pipeline():
+                reset_state()
+                hist = data.getCityData(city_name=query)
+                return JsonResponse(forecaster.getForecastData(data=hist, engine=engine)).content
+
+            bench(f"pipeline/cold/{engine}/{query}", pipeline, repeat=args.forecast_repeat)
+
+    return results
+
+
+def metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "stations": fixtures.stations(),
+        "queries": fixtures.queries(),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float) -> bool:
+    """Print the fastest sample of every benchmark against the baseline.
+
+    Returns:
+        bool: Whether any benchmark is more than threshold times slower.
+    """
+    regressed = False
+    print(f"\n{'benchmark':<48} {'baseline':>12} {'now':>12} {'ratio':>7}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["min"] / baseline[name]["min"]
+        flag = ""
+        if ratio > threshold:
+            regressed, flag = True, "  REGRESSION"
+        print(
+            f"{name:<48} {baseline[name]['min'] * 1e3:>10.3f}ms "
+            f"{result['min'] * 1e3:>10.3f}ms {ratio:>7.2f}{flag}"
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="Fewer samples, batch-theta only.")
+    parser.add_argument("--repeat", type=int, default=7, help="Samples of the fast benchmarks.")
+    parser.add_argument("--forecast-repeat", type=int, default=3, help="Samples of forecasts.")
+    parser.add_argument("--engines", nargs="+", help="Forecast engines, defaults to all.")
+    parser.add_argument("--horizons", nargs="+", type=int, default=HORIZONS)
+    parser.add_argument("--executor", default="process", help="process, thread or serial.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with.")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    # Deprecation and cache key warnings would drown the results table.
+    warnings.simplefilter("ignore")
+
+    if not fixtures.stations():
+        fixtures.synthesize()
+
+    setup_django()
+    from predictor import forecaster
+
+    if args.quick:
+        args.repeat, args.forecast_repeat = 3, 1
+        args.engines = args.engines or ["batch-theta"]
+    args.engines = args.engines or list(forecaster.ENGINES)
+
+    report = {"meta": metadata(), "results": run_suite(args)}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())["results"]
+        if compare(report["results"], baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Local stand-in for the WAQI endpoints, serving the recorded fixtures.
+
+Usage:
+    with WAQIStub() as stub, stub.offline():
+        data.getCityData(city_name="delhi")
+"""
+import contextlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+import fixtures
+
+# Hosts whose requests are answered by the stub while offline() is active.
+UPSTREAM_HOSTS = ["https://api.waqi.info/", "https://search.waqi.info/"]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, do not let them wait for ACKs.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+
+        stream = re.fullmatch(r"/api/attsse/(\d+)/yd\.json", path)
+        if stream and fixtures.sse_path(int(stream[1])).exists():
+            self._send(fixtures.sse_path(int(stream[1])).read_bytes(), "text/event-stream")
+        elif stream:
+            # What the backend answers for an unknown station.
+            self._send(b"<html>Unknown station</html>", "text/html")
+        elif path.startswith("/nsearch/station/"):
+            search = fixtures.search_path(unquote(path.rsplit("/", 1)[1]))
+            body = search.read_bytes() if search.exists() else b'{"results": []}'
+            self._send(body, "application/json")
+        elif path.startswith("/map/bounds"):
+            # No station positions are recorded.
+            self._send(json.dumps({"status": "ok", "data": []}).encode(), "application/json")
+        elif path.startswith("/feed/"):
+            self._send(json.dumps({"status": "ok", "data": {}}).encode(), "application/json")
+        else:
+            self._send(b"Not Found", "text/plain", status=404)
+
+    def _send(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WAQIStub:
+    """HTTP server on a free local port answering like the WAQI endpoints."""
+
+    def __enter__(self) -> "WAQIStub":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self.url = f"http://127.0.0.1:{self._server.server_port}/"
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @contextlib.contextmanager
+    def offline(self):
+        """Route the WAQI calls of predictor.client to the stub."""
+        from predictor import client
+
+        get = client.get
+
+        def stub_get(url, **kwargs):
+            for host in UPSTREAM_HOSTS:
+                if url.startswith(host):
+                    url = self.url + url[len(host):]
+            return get(url, **kwargs)
+
+        client.get = stub_get
+        try:
+            yield self
+        finally:
+            client.get = get
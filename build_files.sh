@@ -1,2 +1,3 @@
 pip install -r requirements.txt 
-python manage.py collectstatic
\ No newline at end of file
+python manage.py collectstatic
+python manage.py migrate --noinput
\ No newline at end of file
@@ -1,3 +1,12 @@
 from django.contrib import admin
 
+from .models import CityRequest, Flight, ForecastJob, ModelVersion, Observation, ProphetFit, Station
+
 # Register your models here.
+admin.site.register(Station)
+admin.site.register(Observation)
+admin.site.register(ProphetFit)
+admin.site.register(CityRequest)
+admin.site.register(ForecastJob)
+admin.site.register(ModelVersion)
+admin.site.register(Flight)
@@ -0,0 +1,284 @@
+import itertools
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy
+import pandas as pd
+from sktime.forecasting.base import ForecastingHorizon
+
+from .batch import BatchThetaForecaster
+from . import preprocess
+from .forecaster import ENGINES, MAX_WORKERS, MIN_READINGS, _bound, _fit_predict, _training_frame, get_executor
+from .pooled import PooledForecaster
+
+# Days forecast from every cutoff.
+HORIZON: int = 30
+
+# Cutoffs per station, STEP days apart, the last one HORIZON days before the
+# end of the data.
+CUTOFFS: int = 10
+STEP: int = 7
+
+# Shortest training series a cutoff may leave, in days.
+MIN_TRAIN: int = 90
+
+# Relative sMAPE an engine may lose to the most accurate one and still be
+# picked for being cheaper.
+TOLERANCE: float = 0.05
+
+
+def rolling_cutoffs(n: int, horizon: int = HORIZON, cutoffs: int = CUTOFFS, step: int = STEP) -> List[int]:
+    """Positions of the rolling forecast origins in a series of n periods.
+
+    Every cutoff trains on the periods before it and is scored on the
+    horizon periods from it, so the last one is n - horizon.
+
+    Raises:
+        ValueError: If the series is too short for a single cutoff.
+    """
+    last = n - horizon
+    positions = [last - i * step for i in range(cutoffs)]
+    positions = [p for p in positions if p >= MIN_TRAIN]
+    if not positions:
+        raise ValueError(f"{n} periods are too few to backtest a {horizon} period horizon.")
+    return sorted(positions)
+
+
+def _forecast_cutoff(forecaster, frame, cutoff, horizon, confidence, lookback=None, memory_budget=None):
+    """Fit forecaster on the rows of frame before cutoff and predict the next horizon rows.
+
+    Runs in the executor's workers, so it must stay a module level function.
+    The rows are cut to lookback and memory_budget like sktime_forecast does.
+
+    Returns:
+        Tuple: The forecast and the lower and upper interval bounds, each of
+            shape (horizon, columns), the seconds fitting and predicting took
+            and the number of rows fitted on.
+    """
+    train = _bound(frame.iloc[:cutoff], forecaster, lookback, memory_budget)
+    start = time.perf_counter()
+
+    if isinstance(forecaster, BatchThetaForecaster):
+        model = forecaster.clone().fit(train.to_numpy(dtype="float64"))
+        mean, lower, upper = model.predict(numpy.arange(1, horizon + 1), confidence=confidence)
+        return mean, lower, upper, time.perf_counter() - start, len(train)
+
+    if isinstance(forecaster, PooledForecaster):
+        # Trained on the station alone, where the served model has seen
+        # every station of the store.
+        model = forecaster.clone().fit([train])
+        mean, lower, upper = model.predict(train, numpy.arange(1, horizon + 1), confidence=confidence)
+        return mean, lower, upper, time.perf_counter() - start, len(train)
+
+    fh = ForecastingHorizon(frame.index[cutoff : cutoff + horizon], is_relative=False)
+    mean, lower, upper = (numpy.empty((horizon, frame.shape[1])) for _ in range(3))
+    for i, col in enumerate(frame.columns):
+        y = train[col].dropna()
+        if len(y) < MIN_READINGS:
+            # Nothing to fit, the column is left out of the scores.
+            mean[:, i] = lower[:, i] = upper[:, i] = numpy.nan
+            continue
+        y_pred, ci, _ = _fit_predict(forecaster, y, fh, confidence)
+        mean[:, i] = y_pred.to_numpy()
+        lower[:, i] = ci.iloc[:, 0].to_numpy()
+        upper[:, i] = ci.iloc[:, 1].to_numpy()
+    return mean, lower, upper, time.perf_counter() - start, len(train)
+
+
+def error_metrics(
+    actual: numpy.ndarray, mean: numpy.ndarray, lower: numpy.ndarray, upper: numpy.ndarray
+) -> Dict[str, numpy.ndarray]:
+    """Accuracy of forecasts from many cutoffs, computed over whole arrays.
+
+    Args:
+        actual (numpy.ndarray): Observations of shape (cutoffs, horizon, columns).
+        mean (numpy.ndarray): Forecasts of the same shape.
+        lower (numpy.ndarray): Lower interval bounds of the same shape.
+        upper (numpy.ndarray): Upper interval bounds of the same shape.
+
+    Returns:
+        Dict[str, numpy.ndarray]: Per column MAE, RMSE, sMAPE (in percent),
+            interval coverage and the share of observations without a
+            forecast, and the MAE at every step of the horizon.
+    """
+    # Missing observations and missing forecasts are nan and left out of the
+    # errors. Missing forecasts are counted apart, and are never covered.
+    observed = ~numpy.isnan(actual)
+    unforecast = observed & numpy.isnan(mean)
+    error = mean - actual
+    absolute = numpy.abs(error)
+    scale = numpy.abs(actual) + numpy.abs(mean)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        smape = numpy.where(scale > 0, 2 * absolute / scale, 0.0)
+    smape[~observed | numpy.isnan(mean)] = numpy.nan
+    covered = numpy.where(observed, (actual >= lower) & (actual <= upper), numpy.nan)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        missing = unforecast.sum(axis=(0, 1)) / observed.sum(axis=(0, 1))
+
+    return {
+        "mae": numpy.nanmean(absolute, axis=(0, 1)),
+        "rmse": numpy.sqrt(numpy.nanmean(error * error, axis=(0, 1))),
+        "smape": 100 * numpy.nanmean(smape, axis=(0, 1)),
+        "coverage": numpy.nanmean(covered, axis=(0, 1)),
+        "missing": missing,
+        "mae_by_step": numpy.nanmean(absolute, axis=(0, 2)),
+    }
+
+
+def backtest(
+    dataset: pd.DataFrame,
+    forecaster: Any,
+    horizon: int = HORIZON,
+    cutoffs: int = CUTOFFS,
+    step: int = STEP,
+    confidence: float = 0.9,
+    frequency: str = "D",
+    executor: Any = "process",
+    max_workers: int = MAX_WORKERS,
+    lookback: Optional[str] = None,
+    memory_budget: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Evaluate a forecaster from rolling cutoffs, the cutoffs in parallel.
+
+    Args:
+        dataset (pd.DataFrame or preprocess.Prepared): Time series with a
+            datetime index, one column per pollutant, as sktime_forecast
+            takes it.
+        forecaster: Configured forecaster, see forecaster.ENGINES.
+        horizon (int, optional): Periods forecast from every cutoff.
+        cutoffs (int, optional): Maximum number of cutoffs.
+        step (int, optional): Periods between cutoffs.
+        confidence (float, optional): Coverage of the prediction intervals.
+        frequency (str, optional): Frequency the data is resampled to.
+        executor (str or concurrent.futures.Executor, optional): "process",
+            "thread", "serial" or an executor instance.
+        max_workers (int, optional): Maximum number of concurrent cutoffs.
+        lookback (str, optional): History fitted on from every cutoff, see
+            preprocess.bound. Defaults to preprocess.LOOKBACK.
+        memory_budget (int, optional): Bytes a fit may take. Defaults to
+            preprocess.MEMORY_BUDGET.
+
+    Returns:
+        Dict[str, Any]: The cutoff dates, the error_metrics by column, the
+            mean seconds fitting and predicting took and the mean rows fitted
+            on per cutoff, and the wall clock seconds of the whole backtest.
+    """
+    frame = _training_frame(dataset, frequency)
+    positions = rolling_cutoffs(len(frame), horizon, cutoffs, step)
+
+    if isinstance(executor, str):
+        executor = get_executor(executor, max_workers)
+    run = map if executor is None else executor.map
+
+    start = time.perf_counter()
+    results = list(
+        run(
+            _forecast_cutoff,
+            itertools.repeat(forecaster),
+            itertools.repeat(frame),
+            positions,
+            itertools.repeat(horizon),
+            itertools.repeat(confidence),
+            itertools.repeat(lookback),
+            itertools.repeat(memory_budget),
+        )
+    )
+    wall_seconds = time.perf_counter() - start
+
+    values = frame.to_numpy(dtype="float64")
+    actual = numpy.stack([values[p : p + horizon] for p in positions])
+    mean, lower, upper = (numpy.stack([r[i] for r in results]) for i in range(3))
+    metrics = error_metrics(actual, mean, lower, upper)
+
+    return {
+        "cutoffs": [frame.index[p].strftime("%Y-%m-%d") for p in positions],
+        "columns": list(frame.columns),
+        **{
+            name: dict(zip(frame.columns, metric.tolist()))
+            for name, metric in metrics.items()
+            if name != "mae_by_step"
+        },
+        "mae_by_step": metrics["mae_by_step"].tolist(),
+        "fit_seconds": float(numpy.mean([r[3] for r in results])),
+        "train_rows": float(numpy.mean([r[4] for r in results])),
+        "wall_seconds": wall_seconds,
+    }
+
+
+def compare_engines(
+    dataset: pd.DataFrame,
+    engines: Optional[List[str]] = None,
+    lookbacks: Optional[List[str]] = None,
+    **kwargs,
+) -> List[Dict[str, Any]]:
+    """Backtest every engine with every lookback policy on the same dataset.
+
+    Args:
+        dataset (pd.DataFrame): See backtest.
+        engines (List[str], optional): Names in forecaster.ENGINES. Defaults to all.
+        lookbacks (List[str], optional): Policies in
+            preprocess.LOOKBACK_POLICIES. Defaults to preprocess.LOOKBACK.
+        **kwargs: Passed on to backtest.
+
+    Returns:
+        List[Dict[str, Any]]: The backtest of every engine and policy, with
+            their names and the sMAPE, coverage and share of missing
+            forecasts averaged over the columns (smape_mean, coverage_mean
+            and missing_mean).
+    """
+    report = []
+    for engine in engines or list(ENGINES):
+        for lookback in lookbacks or [preprocess.LOOKBACK]:
+            result = backtest(dataset, ENGINES[engine](), lookback=lookback, **kwargs)
+            report.append(
+                {
+                    "engine": engine,
+                    "lookback": lookback,
+                    "smape_mean": float(numpy.nanmean(list(result["smape"].values()))),
+                    "coverage_mean": float(numpy.nanmean(list(result["coverage"].values()))),
+                    "missing_mean": float(numpy.nanmean(list(result["missing"].values()))),
+                    **result,
+                }
+            )
+    return report
+
+
+def summarize(reports: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Average compare_engines reports of several stations by engine and policy, cheapest first."""
+    by_engine: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for report in reports:
+        for result in report:
+            by_engine.setdefault((result["engine"], result["lookback"]), []).append(result)
+
+    summary = [
+        {
+            "engine": engine,
+            "lookback": lookback,
+            "stations": len(results),
+            "smape": float(numpy.mean([r["smape_mean"] for r in results])),
+            "coverage": float(numpy.mean([r["coverage_mean"] for r in results])),
+            "missing": float(numpy.mean([r["missing_mean"] for r in results])),
+            "fit_seconds": float(numpy.mean([r["fit_seconds"] for r in results])),
+            "train_rows": float(numpy.mean([r["train_rows"] for r in results])),
+        }
+        for (engine, lookback), results in by_engine.items()
+    ]
+    return sorted(summary, key=lambda row: row["fit_seconds"])
+
+
+def cheapest(summary: List[Dict[str, Any]], tolerance: float = TOLERANCE) -> Tuple[Dict[str, Any], float]:
+    """Pick the fastest engine and policy whose sMAPE is within tolerance of the best one.
+
+    Only the rows leaving the fewest observations without a forecast are
+    considered, since sMAPE is computed over the forecast ones alone.
+
+    Returns:
+        Tuple[Dict[str, Any], float]: The summarize row and the sMAPE it has
+            to stay under.
+    """
+    fewest_missing = min(row["missing"] for row in summary)
+    summary = [row for row in summary if row["missing"] <= fewest_missing]
+    target = min(row["smape"] for row in summary) * (1 + tolerance)
+    for row in sorted(summary, key=lambda row: row["fit_seconds"]):
+        if row["smape"] <= target:
+            return row, target
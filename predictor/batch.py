@@ -0,0 +1,153 @@
+from statistics import NormalDist
+from typing import Any, Dict, Tuple
+
+import numpy
+
+# Smoothing levels tried for every column, the best one is kept per column.
+ALPHAS = numpy.linspace(0.05, 0.95, 19)
+
+
+class BatchThetaForecaster:
+    """Seasonal Theta forecaster fitted on all columns of a matrix at once.
+
+    Each column is deseasonalized with additive seasonal indices, then
+    forecast with the Theta method: simple exponential smoothing plus half of
+    the linear trend. The smoothing level is picked per column from ALPHAS by
+    one-step-ahead squared error. All steps are NumPy operations over the
+    whole (dates x columns) matrix, so fitting thirteen pollutants costs
+    about as much as fitting one.
+
+    Attributes:
+        sp (int): Seasonal period in steps, e.g. 7 for weekly seasonality of
+            daily data. 1 disables the seasonal adjustment.
+    """
+
+    def __init__(self, sp: int = 7):
+        self.sp = sp
+
+    def get_params(self) -> Dict[str, Any]:
+        """Return the configuration, like sktime forecasters do."""
+        return {"engine": "batch-theta", "sp": self.sp}
+
+    def clone(self) -> "BatchThetaForecaster":
+        """Return an unfitted copy with the same configuration."""
+        return BatchThetaForecaster(sp=self.sp)
+
+    def fit(self, Y: numpy.ndarray) -> "BatchThetaForecaster":
+        """Fit every column of Y.
+
+        Args:
+            Y (numpy.ndarray): Array of shape (dates, columns) at a regular
+                frequency. Leading and trailing nan are filled with the
+                nearest value, so interpolate inner gaps beforehand.
+
+        Returns:
+            BatchThetaForecaster: The fitted forecaster.
+        """
+        Y = numpy.asarray(Y, dtype=numpy.float64)
+        if Y.ndim == 1:
+            Y = Y[:, None]
+        # Columns without any reading are forecast as nan.
+        self.empty_ = numpy.isnan(Y).all(axis=0)
+        Y = _fill_ends(Y)
+        n = len(Y)
+        if n < 2:
+            raise ValueError("At least two observations are needed to fit.")
+
+        # Additive seasonal indices from the deviations to a centered moving
+        # average, so zeros in the data are no problem.
+        sp = self.sp if self.sp > 1 and n >= 2 * self.sp else 1
+        seasonal = numpy.zeros((sp, Y.shape[1]))
+        if sp > 1:
+            trend = _centered_moving_average(Y, sp)
+            deviation = Y - trend
+            for phase in range(sp):
+                seasonal[phase] = numpy.nanmean(deviation[phase::sp], axis=0)
+            seasonal -= seasonal.mean(axis=0)
+        X = Y - seasonal[numpy.arange(n) % sp]
+
+        # Slope of the least squares line through each column.
+        t = numpy.arange(n, dtype=numpy.float64)
+        t_centered = t - t.mean()
+        slope = t_centered @ (X - X.mean(axis=0)) / (t_centered @ t_centered)
+
+        # Simple exponential smoothing for every (alpha, column) pair at once.
+        alphas = ALPHAS[:, None]
+        level = numpy.repeat(X[:1], len(ALPHAS), axis=0)
+        sse = numpy.zeros_like(level)
+        for row in X[1:]:
+            error = row - level
+            sse += error * error
+            level += alphas * error
+
+        best = numpy.argmin(sse, axis=0)
+        columns = numpy.arange(X.shape[1])
+
+        self.alpha_ = ALPHAS[best]
+        self.level_ = level[best, columns]
+        self.slope_ = slope
+        self.sigma_ = numpy.sqrt(sse[best, columns] / (n - 1))
+        self.seasonal_ = seasonal
+        self.n_ = n
+        return self
+
+    def predict(
+        self, steps: numpy.ndarray, confidence: float = 0.9
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """Forecast the fitted columns.
+
+        Args:
+            steps (numpy.ndarray): Steps ahead of the last observation, 1 being
+                the next one.
+            confidence (float, optional): Coverage of the prediction interval.
+                Defaults to 0.9.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]: The forecast and
+                the lower and upper interval bounds, each of shape
+                (steps, columns). Columns fitted without any data are nan.
+        """
+        h = numpy.asarray(steps, dtype=numpy.float64)[:, None]
+        alpha = self.alpha_[None, :]
+
+        # Theta method with theta = 2 (Hyndman & Billah, 2003).
+        drift = 0.5 * self.slope_ * (
+            h - 1 + 1 / alpha - (1 - alpha) ** self.n_ / alpha
+        )
+        phase = (self.n_ - 1 + numpy.asarray(steps)) % len(self.seasonal_)
+        mean = self.level_ + drift + self.seasonal_[phase]
+
+        # Prediction interval of simple exponential smoothing.
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        half_width = z * self.sigma_ * numpy.sqrt(1 + (h - 1) * alpha**2)
+        mean, lower, upper = mean, mean - half_width, mean + half_width
+        for block in (mean, lower, upper):
+            block[:, self.empty_] = numpy.nan
+        return mean, lower, upper
+
+
+def _fill_ends(Y: numpy.ndarray) -> numpy.ndarray:
+    """Fill leading and trailing nan of every column with its nearest value."""
+    Y = Y.copy()
+    valid = ~numpy.isnan(Y)
+    has_data = valid.any(axis=0)
+    Y[:, ~has_data] = 0
+    first = numpy.argmax(valid, axis=0)
+    last = len(Y) - 1 - numpy.argmax(valid[::-1], axis=0)
+    rows = numpy.arange(len(Y))[:, None]
+    columns = numpy.arange(Y.shape[1])
+    Y = numpy.where(rows < first, Y[first, columns], Y)
+    Y = numpy.where(rows > last, Y[last, columns], Y)
+    return Y
+
+
+def _centered_moving_average(Y: numpy.ndarray, sp: int) -> numpy.ndarray:
+    """Centered moving average of window sp along the rows, nan at the edges."""
+    cumsum = numpy.vstack([numpy.zeros((1, Y.shape[1])), numpy.cumsum(Y, axis=0)])
+    average = numpy.full_like(Y, numpy.nan)
+    window = (cumsum[sp:] - cumsum[:-sp]) / sp
+    if sp % 2 == 0:
+        # An even window is averaged with the next one to center it.
+        window = (window[:-1] + window[1:]) / 2
+    average[sp // 2 : sp // 2 + len(window)] = window
+    return average
@@ -0,0 +1,96 @@
+import hashlib
+import os
+from typing import Any, Dict, Optional
+
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+# Alias of the cache in settings.CACHES that holds forecast payloads.
+FORECAST_CACHE: str = "forecasts"
+
+# Bumped whenever the layout of the cached payload, or the data it is
+# computed from, changes.
+PAYLOAD_VERSION: int = 4
+
+_missing = object()
+
+
+class DiskLRUCache(FileBasedCache):
+    """File based cache that evicts the least recently used entries.
+
+    Django's FileBasedCache culls a random sample of files once MAX_ENTRIES is
+    reached. Here every hit refreshes the file's modification time and the
+    cull removes the files that were read or written longest ago.
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        if value is _missing:
+            return default
+        try:
+            os.utime(self._key_to_file(key, version))
+        except OSError:
+            # The file may have been culled by another process.
+            pass
+        return value
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+
+        def last_used(fname):
+            try:
+                return os.path.getmtime(fname)
+            except OSError:
+                return 0
+
+        filelist.sort(key=last_used)
+        for fname in filelist[: int(num_entries / self._cull_frequency)]:
+            self._delete(fname)
+
+
+def forecast_key(
+    station_id: int,
+    last_date: Any,
+    start_date: Any,
+    horizon: int,
+    frequency: str,
+    config: Dict[str, Any],
+) -> str:
+    """Build the cache key of a forecast.
+
+    Args:
+        station_id (int): The WAQI city ID of the station.
+        last_date (Any): Date of the most recent observation the fit used.
+        start_date (Any): First forecast date.
+        horizon (int): Forecast horizon.
+        frequency (str): Forecast frequency.
+        config (Dict[str, Any]): Parameters of the forecaster.
+
+    Returns:
+        str: A key that changes whenever any of the arguments does.
+    """
+    return f"forecast:{PAYLOAD_VERSION}:{station_id}:{last_date}:{start_date}:{horizon}:{frequency}:{config_hash(config)}"
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    """Short digest of a forecaster's parameters."""
+    config_repr = repr(sorted(config.items())).encode()
+    return hashlib.sha1(config_repr).hexdigest()[:16]
+
+
+def get_forecast(key: str) -> Optional[Dict[str, Any]]:
+    """Return the cached forecast payload for key, or None."""
+    return caches[FORECAST_CACHE].get(key)
+
+
+def set_forecast(key: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> None:
+    """Cache a forecast payload under key, for timeout seconds or the cache's TIMEOUT."""
+    if timeout is None:
+        caches[FORECAST_CACHE].set(key, payload)
+    else:
+        caches[FORECAST_CACHE].set(key, payload, timeout)
@@ -0,0 +1,113 @@
+import functools
+from typing import Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import throttle
+
+# Seconds to wait for a connection and for each read from the WAQI servers.
+CONNECT_TIMEOUT: float = 5
+READ_TIMEOUT: float = 30
+
+# Connections kept alive per host, shared by every thread of the process.
+POOL_SIZE: int = 10
+
+# Retries for failed connections and transient upstream errors. Connections
+# are retried by the session, statuses by get() through the rate limiter.
+RETRIES: int = 3
+RETRY_BACKOFF: float = 0.5
+RETRY_STATUSES: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+
+@functools.lru_cache(maxsize=None)
+def get_session() -> requests.Session:
+    """Return the process-wide session used for every WAQI call.
+
+    The session pools keep-alive connections per host and retries idempotent
+    requests on connection errors.
+    """
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _retry_after(r: requests.Response) -> Optional[float]:
+    """Seconds in the Retry-After header of a response, if it gives any."""
+    try:
+        return max(float(r.headers["Retry-After"]), 0.0)
+    except (KeyError, ValueError):
+        return None
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """Make a GET request through the shared session, with default timeouts.
+
+    Every attempt takes a token from the rate limiter shared by the workers,
+    and transient status codes make all of them back off, for Retry-After
+    or else exponentially longer after each attempt, see predictor.throttle.
+
+    Args:
+        url (str): The url to make the request to.
+        **kwargs: Passed on to requests.Session.get.
+
+    Returns:
+        requests.Response: The response from the server.
+    """
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    for attempt in range(RETRIES + 1):
+        throttle.acquire()
+        r = get_session().get(url, **kwargs)
+        if r.status_code not in RETRY_STATUSES:
+            return r
+
+        # The only wait before the next attempt, taken by its acquire().
+        retry_after = _retry_after(r)
+        throttle.backoff(RETRY_BACKOFF * 2 ** attempt if retry_after is None else retry_after)
+        if attempt == RETRIES:
+            return r
+        r.close()
+    return r
+
+
+def iter_events(r: requests.Response) -> Iterator[Tuple[str, str]]:
+    """Parse the server-sent events of a streamed response as they arrive.
+
+    Args:
+        r (requests.Response): A response opened with stream=True.
+
+    Yields:
+        Tuple[str, str]: The event type and data of every event.
+    """
+    r.encoding = r.encoding or "utf-8"
+    event, data = "message", []
+    for line in r.iter_lines(decode_unicode=True):
+        if not line:
+            if data or event != "message":
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue
+        else:
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+
+    if data or event != "message":
+        yield event, "\n".join(data)
@@ -0,0 +1,123 @@
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import singleflight, store
+
+# Alias of the cache in settings.CACHES that holds current readings.
+CURRENT_CACHE: str = "default"
+
+# Seconds the readings of a station are served from the cache, see
+# settings.CURRENT_AQI_TTL.
+TTL: int = getattr(settings, "CURRENT_AQI_TTL", 5 * 60)
+
+# Species of the feed that are reported, named like the forecast columns.
+POLLUTANTS: Dict[str, str] = {
+    "pm25": "pm2.5",
+    "pm10": "pm10",
+    "o3": "o3",
+    "no2": "no2",
+    "so2": "so2",
+    "co": "co",
+}
+
+
+def parse_feed(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert the "data" of a feed response into current readings.
+
+    Args:
+        data (Dict[str, Any]): The "data" of the feed response of a station.
+
+    Returns:
+        Dict[str, Any]: The readings by pollutant as presentDayData, the
+            station AQI, the dominant pollutant, the time of the readings and
+            the station name. Missing fields are None.
+    """
+    readings = {}
+    for species, reading in (data.get("iaqi") or {}).items():
+        name = POLLUTANTS.get(species)
+        try:
+            value = float(reading["v"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if name is not None:
+            readings[name] = value
+
+    try:
+        aqi = float(data.get("aqi"))
+    except (TypeError, ValueError):
+        # "-" when the station is offline.
+        aqi = None
+    dominant = data.get("dominentpol")
+    return {
+        "presentDayData": readings,
+        "aqi": aqi,
+        "dominant": POLLUTANTS.get(dominant, dominant) or None,
+        "time": (data.get("time") or {}).get("iso"),
+        "station_name": (data.get("city") or {}).get("name"),
+    }
+
+
+def from_store(city_id: int) -> Optional[Dict[str, Any]]:
+    """Current readings from the last stored day of a station, None without any."""
+    last_date, stored = store.load_latest(city_id)
+    # The store also holds the weather series, which are no pollutants.
+    pollutants = {name: species for species, name in POLLUTANTS.items()}
+    readings = {
+        POLLUTANTS.get(p, p): value for p, value in stored.items() if p in POLLUTANTS or p in pollutants
+    }
+    if not readings:
+        return None
+    return {
+        "presentDayData": readings,
+        "aqi": max(readings.values()),
+        "dominant": max(readings, key=readings.get),
+        "time": last_date.isoformat(),
+        "station_name": None,
+    }
+
+
+def current_readings(city_id: int, fetch: Callable[[int], Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Return the current readings of a station, without any forecasting.
+
+    Readings are cached for TTL seconds. On a miss they come from the feed
+    endpoint, or from the local store when the feed fails or has no
+    pollutant readings.
+
+    Args:
+        city_id (int): The WAQI city ID of the station.
+        fetch (Callable[[int], Dict[str, Any]]): Gets the parse_feed readings
+            of a station, e.g. Ozon3.get_current_readings.
+
+    Returns:
+        Optional[Dict[str, Any]]: See parse_feed, with the source, "feed" or
+            "store", or None if neither has readings.
+    """
+    key = f"current:{int(city_id)}"
+    result = caches[CURRENT_CACHE].get(key)
+    if result is not None:
+        return result
+
+    def compute():
+        # Another request may have cached it while this one waited.
+        result = caches[CURRENT_CACHE].get(key)
+        if result is not None:
+            return result
+        try:
+            result = {**fetch(city_id), "source": "feed"}
+        except Exception:
+            result = None
+        if result is None or not result["presentDayData"]:
+            stored = from_store(city_id)
+            result = {**stored, "source": "store"} if stored is not None else None
+        if result is not None:
+            caches[CURRENT_CACHE].set(key, result, TTL)
+        return result
+
+    try:
+        return singleflight.do(key, compute)
+    except (singleflight.FlightError, singleflight.FlightTimeout):
+        # Another worker failed or is still busy, the store is read directly.
+        stored = from_store(city_id)
+        return {**stored, "source": "store"} if stored is not None else None
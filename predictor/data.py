@@ -1,18 +1,17 @@
+import functools
 import itertools
 import json
 import warnings
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, List, Set, Tuple, Union
 
 import numpy
 import pandas
 import requests
-from ratelimit import limits, sleep_and_retry
 
-# 1000 calls per second is the limit allowed by API
-CALLS: int = 1000
-RATE_LIMIT: int = 1
-
-from .decodedata import get_data_from_id
+from . import client, current, geo, singleflight, timing
+from .models import Station
+from .search import parse_candidates, record_search, station_index
+from .store import get_station_history
 
 def _as_float(x: Any) -> float:
     """Convert x into a float. If unable, convert into numpy.nan instead.
@@ -63,6 +62,9 @@ class Ozon3:
 
     _search_aqi_url: str = URLs.search_aqi_url
     _find_stations_url: str = URLs.find_stations_url
+    _find_coordinates_url: str = URLs.find_coordinates_url
+    # Tokens already checked by this process.
+    _validated_tokens: Set[str] = set()
     _default_params: List[str] = [
         "aqi",
         "pm2.5",
@@ -91,7 +93,10 @@ class Ozon3:
         self._check_token_validity()
 
     def _check_token_validity(self) -> None:
-        """Check if the token is valid"""
+        """Check if the token is valid, once per token and process"""
+        if self.token in self._validated_tokens:
+            return
+
         test_city: str = "london"
         r = self._make_api_request(
             f"{self._search_aqi_url}/{test_city}/?token={self.token}"
@@ -100,19 +105,20 @@ class Ozon3:
         self._check_status_code(r)
         if json.loads(r.content)["status"] != "ok":
             warnings.warn("Token may be invalid!")
+        self._validated_tokens.add(self.token)
 
-    @sleep_and_retry
-    @limits(calls=CALLS, period=RATE_LIMIT)
     def _make_api_request(self, url: str) -> requests.Response:
         """Make an API request
 
+        Calls are rate limited by client.get, like every upstream call.
+
         Args:
             url (str): The url to make the request to.
 
         Returns:
             requests.Response: The response from the API.
         """
-        r = requests.get(url)
+        r = client.get(url)
         return r
 
     def _check_status_code(self, r: requests.Response) -> None:
@@ -132,39 +138,111 @@ class Ozon3:
 
     def get_city_station_options(self, city: str) -> pandas.DataFrame:
         """Get available stations for a given city
+
+        Searches are answered from the local station index when the same
+        city was searched recently, see predictor.search. When the network
+        search fails or finds nothing, similar known cities are used.
+
         Args:
             city (str): Name of a city.
 
         Returns:
             pandas.DataFrame: Table of stations and their relevant information.
         """
-        # NOTE, HACK, FIXME:
-        # This functionality was born together with historical data feature.
-        # This endpoint is outside WAQI API's specification, thus not using
-        # _check_and_get_data_obj private method above.
-        # If exists, alternative within API's spec is more than welcome to
-        # replace this implementation.
-        r = requests.get(f"https://search.waqi.info/nsearch/station/{city}")
+        with timing.stage("search"):
+            records = station_index().lookup(city)
+        if records is None:
+            # NOTE, HACK, FIXME:
+            # This functionality was born together with historical data feature.
+            # This endpoint is outside WAQI API's specification, thus not using
+            # _check_and_get_data_obj private method above.
+            # If exists, alternative within API's spec is more than welcome to
+            # replace this implementation.
+            try:
+                with timing.stage("search"):
+                    r = client.get(f"https://search.waqi.info/nsearch/station/{city}")
+                    res = r.json()
+
+                    records = parse_candidates(res["results"])
+                    record_search(city, records)
+            except Exception:
+                records = station_index().similar(city)
+                if not records:
+                    raise
+        if not records:
+            records = station_index().similar(city)
+
+        return pandas.DataFrame(
+            records,
+            columns=["city_id", "country_code", "station_name", "city_url", "score"],
+        ).sort_values(by=["score"], ascending=False)
+
+    def get_map_stations(
+        self, south: float, west: float, north: float, east: float
+    ) -> List[Dict[str, Any]]:
+        """Get the stations inside a bounding box from the map endpoint
+
+        Args:
+            south (float): Southern latitude of the box.
+            west (float): Western longitude of the box.
+            north (float): Northern latitude of the box.
+            east (float): Eastern longitude of the box.
+
+        Returns:
+            List[Dict[str, Any]]: Station records with their positions, see
+                geo.parse_map.
+        """
+        r = self._make_api_request(
+            f"{self._find_coordinates_url}bounds/?latlng={south},{west},{north},{east}&token={self.token}"
+        )
+        self._check_status_code(r)
         res = r.json()
+        if res.get("status") != "ok":
+            raise Exception(f"Map query failed: {res.get('data')}")
+        return geo.parse_map(res["data"])
 
-        city_id, country_code, station_name, city_url, score = [], [], [], [], []
+    def get_current_readings(self, city_id: int) -> Dict[str, Any]:
+        """Get the latest readings of a station from the feed endpoint
 
-        for candidate in res["results"]:
-            city_id.append(candidate["x"])
-            country_code.append(candidate["c"])
-            station_name.append(candidate["n"])
-            city_url.append(candidate["s"].get("u"))
-            score.append(candidate["score"])
+        Args:
+            city_id (int): City ID of the station.
 
-        return pandas.DataFrame(
-            {
-                "city_id": city_id,
-                "country_code": country_code,
-                "station_name": station_name,
-                "city_url": city_url,
-                "score": score,
-            }
-        ).sort_values(by=["score"], ascending=False)
+        Returns:
+            Dict[str, Any]: The readings, see current.parse_feed.
+        """
+        r = self._make_api_request(f"{self._search_aqi_url}@{city_id}/?token={self.token}")
+        self._check_status_code(r)
+        res = r.json()
+        if res.get("status") != "ok":
+            raise Exception(f"Feed query failed: {res.get('data')}")
+        return current.parse_feed(res["data"])
+
+    def locate_station(self, lat: float, lon: float) -> Union[int, None]:
+        """Find the station of a location without a name search
+
+        Answered from the local spatial index, see predictor.geo. Only when
+        no indexed station is near enough, the map around the location is
+        fetched and indexed first.
+
+        Args:
+            lat (float): Latitude of the location.
+            lon (float): Longitude of the location.
+
+        Returns:
+            int: The city ID of the nearest station, or None if there is none
+                within geo.MAX_DISTANCE_KM.
+        """
+        with timing.stage("locate"):
+            city_id = geo.nearest_station(lat, lon)
+            if city_id is None:
+                d = geo.SEARCH_DEGREES
+                records = self.get_map_stations(
+                    max(lat - d, -90), max(lon - d, -180), min(lat + d, 90), min(lon + d, 180)
+                )
+                if records:
+                    geo.save_stations(records)
+                    city_id = geo.nearest_station(lat, lon)
+        return city_id
 
     def get_historical_data(
         self, city: str = None, city_id: int = None  # type: ignore
@@ -210,7 +288,15 @@ class Ozon3:
                     "Only city_id will be used. city argument will be ignored."
                 )
 
-        df = get_data_from_id(city_id)
+            # Station details are known if the station came up in a search
+            station = Station.objects.filter(station_id=city_id).first()
+            station_name = station.name if station else None
+            country_code = station.country_code if station else None
+
+        with timing.stage("history"):
+            # Concurrent requests for the station share one sync. Every caller
+            # gets its own copy, since the frame is modified in place below.
+            df = singleflight.do(f"history:{city_id}", lambda: get_station_history(city_id)).copy()
         if "pm25" in df.columns:
             # This ensures that pm25 data is labelled correctly.
             df.rename(columns={"pm25": "pm2.5"}, inplace=True)
@@ -219,12 +305,66 @@ class Ozon3:
         # df = df.reset_index().rename(columns={"index": "date"})
         # print(df)
 
-        return [df ,city , station_name, country_code]
+        return [df ,city , station_name, country_code, city_id]
+
+@functools.lru_cache(maxsize=None)
+def get_ozon() -> Ozon3:
+    """Return the Ozon3 instance shared by every request of the process."""
+    return Ozon3('a36388df93e27e7fb00282d007eae2e68c561a61')
 
-def getCityData(city_name):
-    o = Ozon3('a36388df93e27e7fb00282d007eae2e68c561a61')
+
+def getCityData(city_name=None, city_id=None, lat=None, lon=None):
+    o = get_ozon()
+
+    #a location goes straight to its nearest station, no name search
+    if city_id is None and lat is not None and lon is not None:
+        city_id = o.locate_station(lat, lon)
+        if city_id is None:
+            return 404
     
-    data = o.get_historical_data(city=city_name)
+    data = o.get_historical_data(city=city_name, city_id=city_id)
     
     return data
 
+
+def getCurrentData(city_name=None, city_id=None, lat=None, lon=None):
+    o = get_ozon()
+    station_name = country_code = None
+
+    #same station as getCityData picks, but only today's readings are fetched
+    if city_id is None and lat is not None and lon is not None:
+        city_id = o.locate_station(lat, lon)
+    elif city_id is None:
+        search_result = o.get_city_station_options(city_name)
+        if len(search_result) == 0:
+            return 404
+        first_result = search_result.iloc[0, :]
+        city_id = first_result["city_id"]
+        station_name = first_result["station_name"]
+        country_code = first_result["country_code"]
+    if city_id is None:
+        return 404
+
+    with timing.stage("current"):
+        readings = current.current_readings(int(city_id), o.get_current_readings)
+    if readings is None:
+        return 404
+
+    if station_name is None:
+        station = Station.objects.filter(station_id=city_id).first()
+        station_name = station.name if station and station.name else readings["station_name"]
+        country_code = station.country_code if station else None
+
+    return {
+        'code' : 200,
+        'response' : {
+            "presentDayData" : readings["presentDayData"],
+            "aqi" : readings["aqi"],
+            "dominant" : readings["dominant"],
+            "time" : readings["time"],
+            "source" : readings["source"],
+            "city_name" : city_name,
+            "city_station" : station_name,
+            "country_code" : country_code
+        }
+    }
@@ -1,11 +1,14 @@
-import js2py
-import requests
-from sseclient import SSEClient
+import numpy
 import pandas
 
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+import functools
 import json
-from datetime import datetime
+import math
+import warnings
+from datetime import date, datetime, timedelta
+
+from . import client, timing
 
 
 JS_FUNCS: str = """
@@ -175,45 +178,292 @@ function gatekeep_convert_date_object_to_unix_seconds(t) {
 # See relevant_funcs.py for more information.
 
 
-# Make js context where js code can be executed
-_context = js2py.EvalJs()
-_context.execute(JS_FUNCS)
+# Characters of the compressed series format that only advance the step
+# counter, see a() in JS_FUNCS.
+_SKIP_OPCODES: Dict[str, int] = {"$": 1, "%": 2, "'": 3}
+
+# Display order of the known species, see s() in JS_FUNCS.
+_SPECIES_ORDER: List[str] = ["pm25", "pm10", "o3", "no2", "so2", "co"]
+
+
+def _js_remainder(a: int, b: int) -> int:
+    """Remainder with the sign of the dividend, like the JS % operator."""
+    return a - b * math.trunc(a / b)
+
+
+def _compare_species(first: str, second: str) -> int:
+    """Port of the comparator s() in JS_FUNCS sorts the species with."""
+    i = _SPECIES_ORDER.index(first) if first in _SPECIES_ORDER else -1
+    r = _SPECIES_ORDER.index(second) if second in _SPECIES_ORDER else -1
+    return 1 if r < 0 else -1 if i < 0 else i - r
+
+
+def _read_number(data: str, idx: int) -> Tuple[int, int]:
+    """Read the signed integer that follows position idx, like u() in JS_FUNCS.
+
+    Returns:
+        Tuple[int, int]: The number and the position of the last character read.
+    """
+    sign = 1
+    if data[idx + 1 : idx + 2] == "-":
+        sign = -1
+        idx += 1
+    number = 0
+    while idx + 1 < len(data) and "0" <= data[idx + 1] <= "9":
+        number = 10 * number + ord(data[idx + 1]) - 48
+        idx += 1
+    if data[idx + 1 : idx + 2] == ".":
+        idx += 1
+    return sign * number, idx
+
+
+def decode_series(data: str) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Decode one compressed series, the native counterpart of a() in JS_FUNCS.
+
+    The string is read once to collect runs of equal deltas. Step indices and
+    values are then expanded from the runs with cumulative sums.
+
+    Args:
+        data (str): The compressed series, without its leading type character.
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: The step index and the value of
+            every decoded point.
+    """
+    deltas: List[int] = []
+    counts: List[int] = []
+    skips: List[int] = []
+    scales: List[float] = []
+
+    skip, repeat, scale = 0, 0, 1.0
+    idx = 0
+    while idx < len(data):
+        h = data[idx]
+        delta = None
+        if idx == 0 and h == "*":
+            number, idx = _read_number(data, idx)
+            scale = 1 / number if number else math.inf
+            idx += 1
+        elif h in _SKIP_OPCODES:
+            skip += _SKIP_OPCODES[h]
+        elif h == "/":
+            scale, idx = _read_number(data, idx)
+            idx += 1
+        elif h == "!":
+            delta, idx = _read_number(data, idx)
+        elif h == "|":
+            number, idx = _read_number(data, idx)
+            skip += number - 1
+        elif "A" <= h <= "Z":
+            delta = ord(h) - 65
+        elif "a" <= h <= "z":
+            delta = -(ord(h) - 97) - 1
+        elif "0" <= h <= "9":
+            repeat = 10 * repeat + ord(h) - 48
+        else:
+            raise ValueError(f"decode: invalid character {ord(h)} ({h}) at {idx}")
+
+        if delta is not None:
+            deltas.append(delta)
+            counts.append(repeat or 1)
+            skips.append(skip)
+            scales.append(scale)
+            skip, repeat = 0, 0
+        idx += 1
+
+    run_lengths = numpy.asarray(counts, dtype=numpy.int64)
+    steps = numpy.ones(run_lengths.sum(), dtype=numpy.int64)
+    steps[numpy.cumsum(run_lengths) - run_lengths] += numpy.asarray(skips, dtype=numpy.int64)
+
+    indices = numpy.cumsum(steps)
+    values = numpy.cumsum(
+        numpy.repeat(numpy.asarray(deltas, dtype=numpy.int64), run_lengths)
+    ) * numpy.repeat(numpy.asarray(scales, dtype=numpy.float64), run_lengths)
+    return indices, values
+
+
+def _week_start(step: int) -> datetime:
+    """Start of the week a weekly step falls in, as computed by s() in JS_FUNCS."""
+    week = _js_remainder(step, 53)
+    year = (step - week) // 53
+    jan_first = datetime(year, 1, 1)
+    day = 2 + 7 * (week - 1) - (jan_first.weekday() + 1) % 7
+    return jan_first + timedelta(days=day - 1)
+
+
+def _month_start(step: int) -> datetime:
+    """Start of the month a monthly step falls in, as computed by s() in JS_FUNCS."""
+    month = _js_remainder(step, 12)
+    year = (step - month) // 12
+    return datetime(year + (month // 12), month % 12 + 1, 1)
+
+
+def _decode_periodic(data: str, start: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Decode a weekly ("2w") or monthly series into per-period value lists."""
+    period_start = _week_start if data[1] == "w" else _month_start
+
+    groups: Dict[int, List[float]] = {}
+    for chunk in data[3:].split("/"):
+        indices, values = decode_series(chunk)
+        for index, value in zip(indices.tolist(), values.tolist()):
+            groups.setdefault(index, []).append(value)
+
+    # The JS path collects the periods from an object keyed by step, which
+    # js2py enumerates in string order.
+    order = sorted(groups, key=str)
+
+    dates = numpy.array(
+        [period_start(k + start) for k in order], dtype="datetime64[ms]"
+    )
+    values = numpy.empty(len(order), dtype=object)
+    values[:] = [groups[k] for k in order]
+    return dates, values
+
+
+def decode_message(msg: Dict[str, Any]) -> Dict[str, Tuple[numpy.ndarray, numpy.ndarray]]:
+    """Decode a backend message natively, the counterpart of s() in JS_FUNCS.
+
+    Dates are naive UTC wall-clock times, which is what the JS path yields
+    with the project's TIME_ZONE = 'UTC'. Species that fail to decode are
+    skipped with a warning, as the JS path does.
+
+    Args:
+        msg (Dict[str, Any]): The "msg" object of a backend event.
+
+    Returns:
+        Dict[str, Tuple[numpy.ndarray, numpy.ndarray]]: The datetime64 dates and
+            the values of every species, in the order the frontend sorts them.
+    """
+    if not msg:
+        return {}
+
+    result = {}
+    # js2py enumerates object keys in sorted order, so the species are visited
+    # in that order before being sorted for display.
+    for pollutant in sorted(msg["ps"]):
+        data = msg["ps"][pollutant]
+        try:
+            if data[0] == "1":
+                indices, values = decode_series(data[1:])
+                milliseconds = numpy.trunc(
+                    3600 * (indices * msg["dh"] + msg["st"]) * 1e3
+                ).astype(numpy.int64)
+                dates = milliseconds.astype("datetime64[ms]")
+            elif data[0] == "2":
+                dates, values = _decode_periodic(data, msg["st"])
+            else:
+                dates = numpy.array([], dtype="datetime64[ms]")
+                values = numpy.array([], dtype=numpy.float64)
+        except (ValueError, IndexError, KeyError, TypeError) as error:
+            warnings.warn(f"decode: Oopps... {error}")
+            continue
+        result[pollutant] = (dates, values)
+
+    order = sorted(result, key=functools.cmp_to_key(_compare_species))
+    return {pollutant: result[pollutant] for pollutant in order}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_js_context():
+    """Build the js2py context that runs JS_FUNCS, on first use only."""
+    import js2py
+
+    context = js2py.EvalJs()
+    context.execute(JS_FUNCS)
+    return context
+
+
+def iter_backend_messages(city_id: int) -> Iterator[Dict[str, Any]]:
+    """Yield the messages of a station's event stream as they arrive.
+
+    Args:
+        city_id (int): The WAQI city ID of the station.
+
+    Yields:
+        Dict[str, Any]: Every decoded JSON event that carries a "msg".
+    """
+    event_data_url = f"https://api.waqi.info/api/attsse/{city_id}/yd.json"
+
+    # A single streamed request both checks the response and reads the events.
+    with client.get(event_data_url, stream=True) as r:
+        # Catch cases where the returned response is not a server-sent events,
+        # i.e. an error.
+        if "text/event-stream" not in r.headers.get("Content-Type", ""):
+            raise Exception(
+                "Server does not return data stream. "
+                f'It is likely that city ID "{city_id}" does not exist.'
+            )
+
+        for event, data in client.iter_events(r):
+            if event == "done":
+                break
+
+            try:
+                if "msg" in data:
+                    yield json.loads(data)
+            except json.JSONDecodeError:
+                pass
 
 
 def get_results_from_backend(city_id: int) -> List[Dict[str, Any]]:
-    event_data_url = f"https://api.waqi.info/api/attsse/{city_id}/yd.json"
+    return list(iter_backend_messages(city_id))
 
-    r = requests.get(event_data_url)
 
-    # Catch cases where the returned response is not a server-sent events,
-    # i.e. an error.
-    if "text/event-stream" not in r.headers["Content-Type"]:
-        raise Exception(
-            "Server does not return data stream. "
-            f'It is likely that city ID "{city_id}" does not exist.'
-        )
+class _SeriesBuffer:
+    """Growable pair of date and value arrays for one pollutant.
 
-    client = SSEClient(event_data_url)
-    result = []
+    Capacity doubles when full, so appending n points costs O(n) copies.
+    """
 
-    for event in client:
-        if event.event == "done":
-            break
+    def __init__(self, capacity: int = 4096):
+        self._capacity = capacity
+        self._size = 0
+        self._dates = numpy.empty(capacity, dtype="datetime64[ms]")
+        self._values = None
 
-        try:
-            if "msg" in event.data:
-                result.append(json.loads(event.data))
-        except json.JSONDecodeError:
-            pass
+    def append(self, dates: numpy.ndarray, values: numpy.ndarray) -> None:
+        if self._values is None:
+            self._values = numpy.empty(self._capacity, dtype=values.dtype)
 
-    return result
+        end = self._size + len(dates)
+        if end > len(self._dates):
+            capacity = max(end, 2 * len(self._dates))
+            self._dates = numpy.resize(self._dates, capacity)
+            self._values = numpy.resize(self._values, capacity)
+        self._dates[self._size : end] = dates
+        self._values[self._size : end] = values
+        self._size = end
+
+    def to_series(self) -> pandas.Series:
+        """Return the points by date, keeping the first received of duplicates."""
+        dates = self._dates[: self._size]
+        values = self._values[: self._size] if self._values is not None else []
+        # Deduplicate because sometimes the backend sends duplicates
+        dates, first = numpy.unique(dates, return_index=True)
+        index = pandas.DatetimeIndex(dates.astype("datetime64[ns]"))
+        return pandas.Series(numpy.asarray(values)[first], index=index)
 
 
 def parse_incoming_result(json_object: dict) -> pandas.DataFrame:
+    result_dict = {}
+    for pollutant_name, (dates, values) in decode_message(json_object["msg"]).items():
+        index = pandas.DatetimeIndex(dates.astype("datetime64[ns]"))
+        result_dict[pollutant_name] = pandas.Series(values, index=index)
+
+    FRAME = pandas.DataFrame(result_dict)
+    return FRAME
+
+
+def parse_incoming_result_js(json_object: dict) -> pandas.DataFrame:
+    """Reference decoder that runs JS_FUNCS through js2py.
+
+    Much slower than parse_incoming_result, kept to check the native decoder
+    against recorded payloads.
+    """
     # Run JS code
     # Function is defined within JS code above
     # Convert result to Python dict afterwards
-    OUTPUT = _context.gatekeep_convert_date_object_to_unix_seconds(
+    OUTPUT = _get_js_context().gatekeep_convert_date_object_to_unix_seconds(
         json_object["msg"]
     ).to_dict()
 
@@ -237,17 +487,61 @@ def parse_incoming_result(json_object: dict) -> pandas.DataFrame:
     return FRAME
 
 
-def get_data_from_id(city_id: int) -> pandas.DataFrame:
-    backend_data = get_results_from_backend(city_id)
-    result = pandas.concat([parse_incoming_result(data) for data in backend_data])
-    # result = parse_incoming_result(backend_data[0])
+def get_data_from_id(city_id: int, since: Optional[date] = None) -> pandas.DataFrame:
+    """Download and decode a station's history.
+
+    With since, messages that end before that day are not kept. Once such a
+    message follows one that reaches since, the stream is sent newest first
+    and the rest of it is not read. A stream sent oldest first is still read
+    to the end, the older messages are only skipped.
+
+    Args:
+        city_id (int): The WAQI city ID of the station.
+        since (Optional[date]): The first day wanted, None for all of them.
+
+    Returns:
+        pandas.DataFrame: Daily readings with one column per pollutant, most
+            recent first, with missing days as nan.
+    """
+    # Decode every message as it arrives and fold it into per-pollutant
+    # buffers, so decoding overlaps with the download.
+    buffers: Dict[str, _SeriesBuffer] = {}
+    first = numpy.datetime64(since, "ms") if since is not None else None
+    reached = False
+    messages = iter_backend_messages(city_id)
+    try:
+        while True:
+            # Time spent waiting for the next event, and then decoding it.
+            with timing.stage("download"):
+                message = next(messages, None)
+            if message is None:
+                break
+            with timing.stage("decode"):
+                decoded = decode_message(message["msg"])
+                if first is not None:
+                    ends = [dates.max() for dates, _ in decoded.values() if len(dates)]
+                    if ends and max(ends) < first:
+                        if reached:
+                            break
+                        continue
+                    reached = reached or bool(ends)
+                for pollutant_name, (dates, values) in decoded.items():
+                    buffers.setdefault(pollutant_name, _SeriesBuffer()).append(dates, values)
+    finally:
+        # Closes the response when the stream is left early.
+        messages.close()
+
+    with timing.stage("reindex"):
+        return _assemble_frame(buffers)
+
+
+def _assemble_frame(buffers: Dict[str, _SeriesBuffer]) -> pandas.DataFrame:
+    """Turn the buffered points into a daily frame, most recent first."""
+    result = pandas.DataFrame({name: buffer.to_series() for name, buffer in buffers.items()})
 
     # Arrange to make most recent appear on top of DataFrame
     result = result.sort_index(ascending=False, na_position="last")
 
-    # Deduplicate because sometimes the backend sends duplicates
-    result = result[~result.index.duplicated()]
-
     # Reindex to make missing dates appear with value nan
     # Conditional is necessary to avoid error when trying to
     # reindex empty dataframe i.e. just in case the returned
@@ -261,4 +555,4 @@ def get_data_from_id(city_id: int) -> pandas.DataFrame:
         # Arrange to make most recent appear on top of DataFrame
         result = result.sort_index(ascending=False, na_position="last")
 
-    return result
\ No newline at end of file
+    return result
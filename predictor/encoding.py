@@ -0,0 +1,115 @@
+import gzip
+import json
+import math
+from typing import Any, Optional
+
+import numpy
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies shorter than this are sent uncompressed, compressing them costs more
+# than it saves.
+MIN_COMPRESS_BYTES: int = 1024
+
+# Compression effort, moderate levels are most of the gain for little CPU.
+GZIP_LEVEL: int = 6
+BROTLI_QUALITY: int = 5
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode obj as compact JSON, with orjson when it is installed.
+
+    NumPy arrays and scalars are encoded natively. NaN and infinities become
+    null either way, JSON.parse rejects them.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=DjangoJSONEncoder().default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(
+        _plain(obj), cls=DjangoJSONEncoder, separators=(",", ":"), allow_nan=False
+    ).encode()
+
+
+def _plain(obj: Any) -> Any:
+    """Turn NumPy values into Python ones and non-finite floats into None, like orjson."""
+    if isinstance(obj, dict):
+        return {key: _plain(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(value) for value in obj]
+    if isinstance(obj, (numpy.ndarray, numpy.generic)):
+        return _plain(obj.tolist())
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    return obj
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick the content coding for an Accept-Encoding header.
+
+    Returns:
+        Optional[str]: "br" when brotli is installed and accepted, else
+            "gzip" when accepted, else None.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+
+    def allowed(coding: str) -> bool:
+        return accepted.get(coding, accepted.get("*", 0.0)) > 0
+
+    if brotli is not None and allowed("br"):
+        return "br"
+    if allowed("gzip"):
+        return "gzip"
+    return None
+
+
+def json_response(request: HttpRequest, obj: Any, status: int = 200) -> HttpResponse:
+    """Encode obj with dumps and compress it as the client accepts.
+
+    Args:
+        request (HttpRequest): The request, for its Accept-Encoding header.
+        obj (Any): The payload.
+        status (int, optional): The status code. Defaults to 200.
+
+    Returns:
+        HttpResponse: An application/json response, gzip or brotli encoded
+            when that is accepted and the body is long enough.
+    """
+    body = dumps(obj)
+    coding = None
+    if len(body) >= MIN_COMPRESS_BYTES:
+        coding = negotiate(request.headers.get("Accept-Encoding", ""))
+    if coding == "br":
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif coding == "gzip":
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+    response = HttpResponse(body, content_type="application/json", status=status)
+    if coding:
+        response["Content-Encoding"] = coding
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
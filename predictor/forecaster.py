@@ -1,16 +1,22 @@
 from sktime.forecasting.base import ForecastingHorizon
-from sktime.forecasting.model_selection import temporal_train_test_split
-from sktime.forecasting.theta import ThetaForecaster
-from sktime.forecasting.naive import NaiveForecaster
 
+import numpy as np
 import pandas as pd
+import functools
+import itertools
+import os
 import sys
-from sktime.forecasting.arima import AutoARIMA
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from sktime.forecasting.fbprophet import Prophet
 from datetime import timedelta
 
 from datetime import datetime
 
+from . import cache, pooled, preprocess, registry, singleflight, timing, warmstart
+from .batch import BatchThetaForecaster
+from .pooled import PooledForecaster
+
 
 sys.path.append("..")
 # import src.utility.plot_settings
@@ -18,24 +24,137 @@ sys.path.append("..")
 # dataset = pd.read_csv("Data/TempNewDelhiData.csv", parse_dates=[0], index_col=[0])
 
 
-def sktime_forecast(dataset, horizon=30, forecaster=Prophet(yearly_seasonality=True, weekly_seasonality=True), validation=False, confidence=0.9, frequency="D"):
+# Upper bound on the columns of a dataset fitted at the same time.
+MAX_WORKERS = os.cpu_count() or 1
+
+# Forecasters getForecastData can use, by name.
+ENGINES = {
+    "prophet": lambda: Prophet(yearly_seasonality=True, weekly_seasonality=True),
+    "batch-theta": lambda: BatchThetaForecaster(sp=7),
+    "pooled": lambda: PooledForecaster(),
+}
+ENGINE = "prophet"
+
+# Start Prophet fits of a known station from its previous parameters.
+WARM_START = True
+
+# Reuse the stored model of a column whose training data did not change,
+# instead of fitting it again. See predictor.registry.
+REGISTRY = True
+
+# Readings a column needs in the bounded history to be fitted. Columns with
+# fewer are left out of the forecast.
+MIN_READINGS = 2
+
+# Memory a fit takes per row of a column, in bytes, from tracemalloc peaks.
+# Used to hold fits to preprocess.MEMORY_BUDGET.
+FIT_ROW_BYTES = {
+    "prophet": 2048,
+    "batch-theta": 64,
+}
+
+# Executor used by sktime_forecast unless told otherwise:
+# "process", "thread" or "serial".
+EXECUTOR = "process"
+
+
+@functools.lru_cache(maxsize=None)
+def get_executor(kind=EXECUTOR, max_workers=MAX_WORKERS):
+    """Return the shared executor of the given kind, creating it on first use.
+
+    Args:
+        kind (str): "process", "thread" or "serial". "serial" returns None.
+        max_workers (int): Maximum number of concurrent fits.
+    """
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=max_workers)
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=max_workers)
+    if kind == "serial":
+        return None
+    raise ValueError(f"Unknown executor {kind!r}.")
+
+
+def _fit_predict(forecaster, y, fh, confidence, init=None, keep=False):
+    """Fit a fresh clone of forecaster on y and predict fh.
+
+    Runs in the executor's workers, so it must stay a module level function.
+    A Prophet forecaster starts from init when given. The fit time, the
+    fitted Prophet parameters and, if keep, the fitted forecaster are
+    returned along with the predictions.
+    """
+    forecaster = forecaster.clone()
+    if init is not None:
+        forecaster._ModelClass = functools.partial(warmstart.WarmProphet, init=init)
+
+    start = time.perf_counter()
+    forecaster.fit(y)
+    seconds = time.perf_counter() - start
+
+    y_pred = forecaster.predict(fh)
+    ci = forecaster.predict_interval(fh, coverage=confidence).astype("float")
+
+    fit = {"seconds": seconds}
+    if isinstance(forecaster, Prophet):
+        fit["params"] = warmstart.extract_params(forecaster._forecaster)
+    if keep:
+        fit["forecaster"] = forecaster
+    return y_pred, ci, fit
+
+
+def sktime_forecast(dataset, horizon=30, forecaster=None, validation=False, confidence=0.9, frequency="D", executor=EXECUTOR, max_workers=MAX_WORKERS, station_id=None, warm_start=WARM_START, use_registry=REGISTRY, columnar=False, lookback=None, memory_budget=None):
     """Loop over a time series dataframe, train an sktime forecasting model, and visualize the results.
 
+    Every column is fitted on its own clone of forecaster, concurrently when
+    an executor is used. A BatchThetaForecaster instead fits all columns in
+    one go, without an executor. A PooledForecaster is not fitted at all, the
+    model trained on every station predicts all columns, see predictor.pooled.
+    Results keep the column order of dataset.
+
     Args:
-        dataset (pd.DataFrame): Input time series DataFrame with datetime index
+        dataset (pd.DataFrame or preprocess.Prepared): Input time series
+            DataFrame with datetime index, or daily data from
+            preprocess.prepare, which is fitted as it is.
         horizon (int): Forecast horizon
-        forecaster (sktime.forecasting): Configured forecaster
+        forecaster (sktime.forecasting, optional): Configured forecaster.
+            Defaults to a new one of the ENGINE kind.
         validation (bool, optional): . Defaults to False.
         confidence (float, optional): Confidence level. Defaults to 0.9.
         frequency (str, optional): . Defaults to "D".
+        executor (str or concurrent.futures.Executor, optional): "process",
+            "thread", "serial" or an executor instance. Defaults to EXECUTOR.
+        max_workers (int, optional): Maximum number of concurrent fits.
+            Defaults to MAX_WORKERS.
+        station_id (int, optional): Station the dataset belongs to, needed
+            for warm starts.
+        warm_start (bool, optional): Start Prophet fits from the parameters
+            of the station's previous fit, and store the new ones. Defaults
+            to WARM_START.
+        use_registry (bool, optional): Predict with the stored model of a
+            column whose training data is unchanged, and store the models
+            fitted otherwise. Needs station_id. Defaults to REGISTRY.
+        columnar (bool, optional): Return the forecast by column with its
+            intervals, see _columnar_data, instead of by date. Defaults to False.
+        lookback (str, optional): History fitted on, see preprocess.bound.
+            Defaults to preprocess.LOOKBACK.
+        memory_budget (int, optional): Bytes the fits may take, fewer rows
+            are fitted on beyond it. Defaults to preprocess.MEMORY_BUDGET.
     """
-    # Adjust frequency
-    forecast_df = dataset.resample(rule=frequency).sum()
-    # Interpolate missing periods (if any)
-    forecast_df = forecast_df.interpolate(method="time")
+    if forecaster is None:
+        forecaster = ENGINES[ENGINE]()
+
+    forecast_df = _training_frame(dataset, frequency)
+    forecast_df = _bound(forecast_df, forecaster, lookback, memory_budget)
+    #a pollutant that stopped reporting before the bounded history cannot be fitted
+    forecast_df = forecast_df.loc[:, forecast_df.count() >= MIN_READINGS]
+    columns = forecast_df.columns
 
-    all_parameters_values = {}
-    for col in dataset.columns:
+    if isinstance(forecaster, (BatchThetaForecaster, PooledForecaster)):
+        with timing.stage("predict" if isinstance(forecaster, PooledForecaster) else "fit"):
+            return _batch_forecast(forecast_df, horizon, forecaster, validation, confidence, frequency, columnar)
+
+    tasks = []
+    for col in columns:
         # Use train/test split to validate forecaster
         if validation:
             df = forecast_df[col]
@@ -43,63 +162,154 @@ def sktime_forecast(dataset, horizon=30, forecaster=Prophet(yearly_seasonality=T
             y_train = df[:-horizon]
             y_test = df.tail(horizon)
 
-            forecaster.fit(y_train)
             fh = ForecastingHorizon(y_test.index, is_relative=False)
-            y_pred = forecaster.predict(fh)
-            ci = forecaster.predict_interval(fh, coverage=confidence).astype("float")
-            y_true = df.tail(horizon)
+            tasks.append((y_train, fh))
 
-            # mae = mean_absolute_error(y_true, y_pred)
+            # mae = mean_absolute_error(y_test, y_pred)
 
         # Make predictions beyond the dataset
         if not validation:
             df = forecast_df[col].dropna()
-          
-            forecaster.fit(df)
 
-            #for present date            
-            present_date = datetime.now().date()
-            #to start predictions from tomorrow
-            present_date = str(present_date + timedelta(days=1)).split(' ')[0]
             fh = ForecastingHorizon(
-                pd.date_range(str(present_date), periods=horizon, freq=frequency),
+                _forecast_dates(horizon, frequency),
                 is_relative=False,
             )
+            tasks.append((df, fh))
+
+    warm_start = warm_start and not validation and station_id is not None and isinstance(forecaster, Prophet)
+    inits = {}
+    if warm_start:
+        inits = warmstart.load_inits(station_id, columns)
+
+    use_registry = use_registry and not validation and station_id is not None
+    config = forecaster.get_params()
+    y_hashes, models = {}, {}
+    if use_registry:
+        with timing.stage("registry"):
+            for col, (y, _) in zip(columns, tasks):
+                y_hashes[col] = registry.data_hash(y)
+                model = registry.load(station_id, col, y_hashes[col], config)
+                if model is not None:
+                    models[col] = model
+
+    to_fit = [(col, y, fh) for col, (y, fh) in zip(columns, tasks) if col not in models]
+
+    if isinstance(executor, str):
+        executor = get_executor(executor, max_workers)
+    run = map if executor is None else executor.map
+
+    # map returns the results in the order of the tasks
+    with timing.stage("fit"):
+        results = list(run(
+            _fit_predict,
+            itertools.repeat(forecaster),
+            [y for _, y, _ in to_fit],
+            [fh for _, _, fh in to_fit],
+            itertools.repeat(confidence),
+            [inits.get(col) for col, _, _ in to_fit],
+            itertools.repeat(use_registry),
+        ))
+    fitted = {col: result for (col, _, _), result in zip(to_fit, results)}
+
+    all_parameters_values, bounds = {}, {}
+    for col, (_, fh) in zip(columns, tasks):
+        if col in models:
+            with timing.stage("predict"):
+                all_parameters_values[col] = models[col].predict(fh).values
+                if columnar:
+                    ci = models[col].predict_interval(fh, coverage=confidence)
+                    bounds[col] = (ci.iloc[:, 0].values, ci.iloc[:, 1].values)
+            continue
+
+        y_pred, ci, fit = fitted[col]
+        all_parameters_values[col] = y_pred.values
+        bounds[col] = (ci.iloc[:, 0].values, ci.iloc[:, 1].values)
+        if warm_start:
+            warmstart.save_fit(station_id, col, fit["params"], fit["seconds"], warm=col in inits)
+        if use_registry:
+            with timing.stage("registry"):
+                registry.save(station_id, col, fit["forecaster"], y_hashes[col], config, fit["seconds"])
+
+    if columnar:
+        return _columnar_data(fh.to_pandas(), all_parameters_values, bounds)
+    return _predicted_data(fh, all_parameters_values)
+
+
+def _training_frame(dataset, frequency):
+    """The regular frame sktime_forecast fits on, from a Prepared or a DataFrame."""
+    if isinstance(dataset, preprocess.Prepared):
+        return dataset.frame()
+    with timing.stage("resample"):
+        return _regularize(dataset, frequency)
+
+
+def _bound(forecast_df, forecaster, lookback=None, memory_budget=None):
+    """Cut forecast_df to the lookback policy and memory budget, see preprocess.bound."""
+    if isinstance(forecaster, PooledForecaster):
+        #trained beforehand, a forecast only reads the last days
+        return forecast_df
+
+    options = {
+        "policy": preprocess.LOOKBACK if lookback is None else lookback,
+        "budget": preprocess.MEMORY_BUDGET if memory_budget is None else memory_budget,
+    }
+    if isinstance(forecaster, BatchThetaForecaster):
+        return preprocess.bound(forecast_df, period=forecaster.sp, regular=True, row_bytes=FIT_ROW_BYTES["batch-theta"], **options)
+    #yearly seasonality is the longest Prophet has
+    return preprocess.bound(forecast_df, period=365, row_bytes=FIT_ROW_BYTES["prophet"], **options)
+
+
+def _regularize(dataset, frequency):
+    """Resample dataset to frequency and interpolate the missing periods."""
+    # Adjust frequency
+    forecast_df = dataset.resample(rule=frequency).sum()
+    # Interpolate missing periods (if any)
+    return forecast_df.interpolate(method="time")
 
-            y_pred = forecaster.predict(fh)
-            ci = forecaster.predict_interval(fh, coverage=confidence).astype("float")
-            # mae = np.nan
-
-        # Visualize results
-        # plt.plot(
-        #     df.tail(horizon * 3),
-        #     label="Actual",
-        #     color="black",
-        # )
-        # plt.gca().fill_between(
-        #     ci.index, (ci.iloc[:, 0]), (ci.iloc[:, 1]), color="b", alpha=0.1
-        # )
-        # # print(y_pred)
-        # plt.plot(y_pred, label="Predicted")
-        # plt.xticks(rotation=45, ha='right')
-        # # plt.title(
-        # #     f"{horizon} day forecast for {col} (mae: {round(mae, 2)}, confidence: {confidence*100}%)"
-        # # )
-        # plt.ylim(bottom=0)
-        # # plt.legend()
-        # plt.grid(False)
-        # plt.show()
-        # print("Mean Absolute Error : ", mae)
-
-        # try :
-        #     temp = all_parameters_values['date']
-        # except:
-        #     all_parameters_values['date'] = [i.strftime("%d-%m-%Y") for i in fh]
 
-        all_parameters_values[col] = y_pred.values
-    
+def _forecast_dates(horizon, frequency):
+    """Dates of a forecast that starts tomorrow."""
+    #for present date            
+    present_date = datetime.now().date()
+    #to start predictions from tomorrow
+    present_date = str(present_date + timedelta(days=1)).split(' ')[0]
+    return pd.date_range(str(present_date), periods=horizon, freq=frequency)
 
-    
+
+def _batch_forecast(forecast_df, horizon, forecaster, validation, confidence, frequency, columnar=False):
+    """sktime_forecast for a BatchThetaForecaster or a PooledForecaster, all columns at once."""
+    if validation:
+        train = forecast_df[:-horizon]
+        dates = forecast_df.index[-horizon:]
+    else:
+        train = forecast_df
+        dates = _forecast_dates(horizon, frequency)
+
+    # Position of every forecast date counted from the last observation
+    steps = pd.date_range(train.index[-1], dates[-1], freq=frequency).get_indexer(dates)
+
+    if isinstance(forecaster, PooledForecaster):
+        y_pred, lower, upper = pooled.trained(forecaster).predict(train, steps, confidence=confidence)
+    else:
+        forecaster = forecaster.clone().fit(train.to_numpy(dtype="float64"))
+        y_pred, lower, upper = forecaster.predict(steps, confidence=confidence)
+
+    all_parameters_values, bounds = {}, {}
+    for i, col in enumerate(forecast_df.columns):
+        if np.isnan(y_pred[:, i]).all():
+            #no readings in the history the forecast is made from
+            continue
+        all_parameters_values[col] = y_pred[:, i]
+        bounds[col] = (lower[:, i], upper[:, i])
+
+    if columnar:
+        return _columnar_data(dates, all_parameters_values, bounds)
+    return _predicted_data(dates, all_parameters_values)
+
+
+def _predicted_data(fh, all_parameters_values):
+    """Arrange forecasts by date, then by column."""
     dates = [i.strftime("%d-%m-%Y") for i in fh]
 
     predicted_data = {}
@@ -112,45 +322,108 @@ def sktime_forecast(dataset, horizon=30, forecaster=Prophet(yearly_seasonality=T
     return predicted_data
 
 
-def getForecastData(data):
-    forecaster = Prophet(yearly_seasonality=True, weekly_seasonality=True)
-
-    finalOut = {}
-    if data != 404:
-
-        dates = [i for i in data[0].index]
-        for i in range(len(dates)):
-            if(dates[i].date() > datetime.now().date()):
-                data[0].drop(index=dates[i].date(), inplace=True)
-
-        dataset = data[0]
-        dataset = dataset.dropna()
-
-        #saving the file locally without index
-        # dataset.to_csv(f"Data/{city_name}_data.csv", index=False)
+def _columnar_data(dates, all_parameters_values, bounds):
+    """Arrange forecasts by column: the dates once, then one array per column.
 
-        #reading the file while parsing the dates
-        # dataset = pd.read_csv(f"Data/{city_name}_data.csv", parse_dates=[0], index_col=[0])
-        # print(dataset)
-        #remove future dates in the dateset
-
-        predicted_data = sktime_forecast(dataset=dataset,forecaster=forecaster, horizon=30, validation=False)
+    Returns:
+        dict: "dates" as YYYY-MM-DD strings, and "values", "lower" and
+            "upper" mapping every column to a list of floats.
+    """
+    forecast = {
+        "dates": pd.DatetimeIndex(dates).strftime("%Y-%m-%d").tolist(),
+        "values": {},
+        "lower": {},
+        "upper": {},
+    }
+    for col, values in all_parameters_values.items():
+        forecast["values"][col] = np.asarray(values, dtype="float64").tolist()
+        forecast["lower"][col] = np.asarray(bounds[col][0], dtype="float64").tolist()
+        forecast["upper"][col] = np.asarray(bounds[col][1], dtype="float64").tolist()
+    return forecast
+
+
+def _nested_data(forecast):
+    """Turn a _columnar_data forecast into the _predicted_data layout script.js reads."""
+    dates = [f"{d[8:10]}-{d[5:7]}-{d[:4]}" for d in forecast["dates"]]
+    columns = forecast["values"]
+    return {
+        date: {col: values[i] for col, values in columns.items()}
+        for i, date in enumerate(dates)
+    }
+
+
+def getForecastData(data, engine=ENGINE, columnar=False, intervals=False, cache_timeout=None):
+    """Forecast the next 30 days of the data getCityData returned.
 
+    Args:
+        data (list): The getCityData output, or 404.
+        engine (str, optional): Name in ENGINES. Defaults to ENGINE.
+        columnar (bool, optional): Respond with the dates once and an array
+            per pollutant instead of the by-date predicted_data of script.js.
+        intervals (bool, optional): Add the lower and upper interval arrays
+            to a columnar response.
+        cache_timeout (float, optional): Seconds the forecast stays cached.
+            Defaults to the TIMEOUT of the forecast cache.
+    """
+    forecaster = ENGINES[engine]()
 
-        #for present day data
-        presentDayData = {}
-        for i in data[0]:
-            if str(data[0][i][0]) != 'nan':
-                presentDayData[i] = data[0][i][0]
-        
-        # print(predicted_data)
+    finalOut = {}
+    if data != 404:
 
+        #daily arrays without future dates, gaps filled per pollutant
+        with timing.stage("preprocess"):
+            dataset = preprocess.prepare(data[0], station_id=data[4])
+
+        #the forecast only changes with the data, the start date and the model
+        config = {**forecaster.get_params(), "lookback" : preprocess.LOOKBACK, "memory_budget" : preprocess.MEMORY_BUDGET}
+        if isinstance(forecaster, PooledForecaster):
+            #a new training of the pooled model replaces its forecasts
+            config["model_version"] = pooled.model_version(forecaster)
+        key = cache.forecast_key(
+            station_id=data[4],
+            last_date=dataset.last_date,
+            start_date=datetime.now().date(),
+            horizon=30,
+            frequency="D",
+            config=config,
+        )
+        with timing.stage("cache"):
+            payload = cache.get_forecast(key)
+            if payload is not None and cache_timeout is not None:
+                #cached by a request, kept as long as asked from now on
+                cache.set_forecast(key, payload, timeout=cache_timeout)
+        if payload is None:
+            def compute():
+                #another worker may have cached it while this one waited
+                payload = cache.get_forecast(key)
+                if payload is None:
+                    #kept by column, the nested layout is derived from it
+                    forecast = sktime_forecast(dataset=dataset,forecaster=forecaster, horizon=30, validation=False, station_id=data[4], columnar=True)
+
+                    payload = {
+                        "forecast" : forecast,
+                        "presentDayData" : dataset.present_day
+                    }
+                    cache.set_forecast(key, payload, timeout=cache_timeout)
+                return payload
+
+            #concurrent requests for the same forecast wait for a single fit
+            payload = singleflight.do(key, compute)
+
+        if columnar:
+            forecast = payload["forecast"]
+            response = {"format" : "columnar", "dates" : forecast["dates"], "values" : forecast["values"]}
+            if intervals:
+                response["lower"] = forecast["lower"]
+                response["upper"] = forecast["upper"]
+        else:
+            response = {"predicted_data" : _nested_data(payload["forecast"])}
 
         finalOut = {
             'code' : 200,
             'response' : {
-                "predicted_data" : predicted_data,
-                "presentDayData" : presentDayData,
+                **response,
+                "presentDayData" : payload["presentDayData"],
                 "city_name" : data[1],
                 "city_station" : data[2],
                 "country_code" : data[3]
@@ -0,0 +1,223 @@
+import json
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy
+from django.db.models import Count, Max
+from scipy.spatial import cKDTree
+
+from .models import Station
+
+# Mean radius of the earth in km.
+EARTH_RADIUS_KM: float = 6371.0088
+
+# A station farther from a location than this does not stand for it.
+MAX_DISTANCE_KM: float = 50.0
+
+# Degrees around a location fetched from the map endpoint when no indexed
+# station is near it.
+SEARCH_DEGREES: float = 0.5
+
+# Most stations a nearest station query of the API returns.
+MAX_NEARBY: int = 50
+
+# Seconds between checks of the stored positions for changes made by other
+# processes, see geo_index().
+REFRESH_SECONDS: float = 60.0
+
+# Degrees of latitude and longitude of every map request of the
+# sync_station_map command.
+TILE_DEGREES: float = 10.0
+
+_index: Optional["GeoIndex"] = None
+# Count and largest city ID of the positioned stations _index was built from.
+_signature: Optional[Dict[str, Any]] = None
+_checked: float = 0.0
+_index_lock = threading.Lock()
+
+
+def parse_map(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convert the stations of a map bounds response into station records.
+
+    Args:
+        entries (List[Dict[str, Any]]): The "data" of the map response.
+
+    Returns:
+        List[Dict[str, Any]]: One record per station, with its city_id,
+            station_name, lat and lon. Stations without a valid position are
+            left out.
+    """
+    records = []
+    for entry in entries:
+        try:
+            lat, lon = float(entry["lat"]), float(entry["lon"])
+            city_id = int(entry["uid"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            continue
+        records.append(
+            {
+                "city_id": city_id,
+                "station_name": (entry.get("station") or {}).get("name", ""),
+                "lat": lat,
+                "lon": lon,
+            }
+        )
+    return records
+
+
+def _unit_vectors(lat: numpy.ndarray, lon: numpy.ndarray) -> numpy.ndarray:
+    """Points on the unit sphere, where straight distances order like great circle ones."""
+    lat, lon = numpy.radians(lat), numpy.radians(lon)
+    return numpy.column_stack(
+        [numpy.cos(lat) * numpy.cos(lon), numpy.cos(lat) * numpy.sin(lon), numpy.sin(lat)]
+    )
+
+
+class GeoIndex:
+    """Spatial index of station positions.
+
+    Nearest station queries go to a KD-tree over the positions on the unit
+    sphere, so they are exact anywhere on the earth, poles and the
+    antimeridian included. Bounding box queries bisect the stations sorted by
+    latitude and filter the longitudes of that band.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        """Index station records, as parse_map returns them."""
+        order = sorted(range(len(records)), key=lambda i: records[i]["lat"])
+        self.ids = numpy.array([int(records[i]["city_id"]) for i in order], dtype=numpy.int64)
+        self.lat = numpy.array([records[i]["lat"] for i in order], dtype=numpy.float64)
+        self.lon = numpy.array([records[i]["lon"] for i in order], dtype=numpy.float64)
+        self._tree = cKDTree(_unit_vectors(self.lat, self.lon)) if len(order) else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Tuple[int, float]]:
+        """Return the k stations nearest to a position.
+
+        Args:
+            lat (float): Latitude in degrees.
+            lon (float): Longitude in degrees.
+            k (int, optional): Number of stations. Defaults to 1.
+
+        Returns:
+            List[Tuple[int, float]]: The city IDs of the stations and their
+                great circle distances in km, nearest first.
+        """
+        if self._tree is None or k < 1:
+            return []
+        # math on the two floats is far cheaper than numpy on one element arrays.
+        phi, lam = math.radians(lat), math.radians(lon)
+        point = numpy.array([math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)])
+        chords, positions = self._tree.query(point, k=min(k, len(self.ids)))
+        chords, positions = numpy.atleast_1d(chords), numpy.atleast_1d(positions)
+        distances = 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.minimum(chords / 2, 1.0))
+        return [(int(self.ids[p]), float(d)) for p, d in zip(positions, distances)]
+
+    def within(self, south: float, west: float, north: float, east: float) -> List[int]:
+        """Return the stations inside a bounding box.
+
+        A box with west greater than east crosses the antimeridian.
+
+        Returns:
+            List[int]: The city IDs of the stations, south to north.
+        """
+        start = numpy.searchsorted(self.lat, south, side="left")
+        end = numpy.searchsorted(self.lat, north, side="right")
+        lon = self.lon[start:end]
+        if west <= east:
+            inside = (lon >= west) & (lon <= east)
+        else:
+            inside = (lon >= west) | (lon <= east)
+        return self.ids[start:end][inside].tolist()
+
+
+def geo_index() -> GeoIndex:
+    """Return the process-wide index, built from the stored station positions.
+
+    Every REFRESH_SECONDS the stored positions are counted, and the index is
+    built again when another process, e.g. sync_station_map, added some.
+    """
+    global _index, _signature, _checked
+    now = time.monotonic()
+    with _index_lock:
+        if _index is not None and now - _checked < REFRESH_SECONDS:
+            return _index
+        stations = Station.objects.filter(lat__isnull=False, lon__isnull=False)
+        signature = stations.aggregate(count=Count("station_id"), last=Max("station_id"))
+        if _index is None or signature != _signature:
+            _index = GeoIndex(
+                [
+                    {"city_id": station.station_id, "station_name": station.name, "lat": station.lat, "lon": station.lon}
+                    for station in stations
+                ]
+            )
+            _signature = signature
+        _checked = now
+        return _index
+
+
+def _clear_index() -> None:
+    """Build the index of this process again on its next use."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def save_stations(records: List[Dict[str, Any]]) -> None:
+    """Persist station positions and rebuild the index of this process."""
+    Station.objects.bulk_create(
+        [
+            Station(station_id=int(r["city_id"]), name=r["station_name"] or "", lat=r["lat"], lon=r["lon"])
+            for r in records
+        ],
+        update_conflicts=True,
+        unique_fields=["station_id"],
+        update_fields=["lat", "lon"],
+    )
+    _clear_index()
+
+
+def nearest_station(lat: float, lon: float, max_distance: float = MAX_DISTANCE_KM) -> Optional[int]:
+    """Return the city ID of the indexed station nearest to a position, if it is close enough."""
+    nearest = geo_index().nearest(lat, lon, k=1)
+    if nearest and nearest[0][1] <= max_distance:
+        return nearest[0][0]
+    return None
+
+
+def tiles(
+    south: float = -90, west: float = -180, north: float = 90, east: float = 180, size: float = TILE_DEGREES
+) -> List[Tuple[float, float, float, float]]:
+    """Split a bounding box into map requests of at most size degrees a side."""
+    rows = max(math.ceil((north - south) / size), 1)
+    columns = max(math.ceil((east - west) / size), 1)
+    lats = numpy.linspace(south, north, rows + 1)
+    lons = numpy.linspace(west, east, columns + 1)
+    return [
+        (float(lats[i]), float(lons[j]), float(lats[i + 1]), float(lons[j + 1]))
+        for i in range(rows)
+        for j in range(columns)
+    ]
+
+
+def load_dump(path: str) -> int:
+    """Fill the index from a saved map bounds response.
+
+    Args:
+        path (str): JSON file holding either a map response or a list of its
+            "data".
+
+    Returns:
+        int: The number of stations loaded.
+    """
+    with open(path) as f:
+        dump = json.load(f)
+    records = parse_map(dump["data"] if isinstance(dump, dict) else dump)
+    save_stations(records)
+    return len(records)
@@ -0,0 +1,88 @@
+import os
+import socket
+from datetime import timedelta
+from typing import Optional
+
+from django.utils import timezone
+
+from .models import ForecastJob
+
+# A running job whose worker has not finished it by then is handed out again.
+STALE_AFTER: timedelta = timedelta(minutes=10)
+
+
+def worker_name() -> str:
+    """Name identifying this worker process across nodes."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def submit(city: str) -> ForecastJob:
+    """Queue a forecast of city and return its job."""
+    return ForecastJob.objects.create(city=city)
+
+
+def requeue_stale() -> int:
+    """Hand out again the jobs of workers that died while running them.
+
+    Returns:
+        int: The number of jobs requeued.
+    """
+    cutoff = timezone.now() - STALE_AFTER
+    return ForecastJob.objects.filter(
+        status=ForecastJob.RUNNING, started_at__lt=cutoff
+    ).update(status=ForecastJob.PENDING, worker="")
+
+
+def claim_next(worker: str) -> Optional[ForecastJob]:
+    """Claim the oldest pending job for worker.
+
+    The claim is a conditional update, so concurrent workers on any node
+    sharing the database never run the same job twice.
+
+    Returns:
+        Optional[ForecastJob]: The claimed job, or None if the queue is empty.
+    """
+    while True:
+        job = (
+            ForecastJob.objects.filter(status=ForecastJob.PENDING)
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+
+        claimed = ForecastJob.objects.filter(
+            pk=job.pk, status=ForecastJob.PENDING
+        ).update(status=ForecastJob.RUNNING, worker=worker, started_at=timezone.now())
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run(job: ForecastJob) -> ForecastJob:
+    """Fetch and forecast the city of a claimed job and store the outcome."""
+    from . import data, forecaster
+
+    try:
+        hist = data.getCityData(city_name=job.city)
+        job.result = forecaster.getForecastData(data=hist)
+        job.status = ForecastJob.DONE
+    except Exception as e:
+        job.error = str(e)
+        job.status = ForecastJob.FAILED
+    job.finished_at = timezone.now()
+    job.save(update_fields=["result", "error", "status", "finished_at"])
+    return job
+
+
+def status(job: ForecastJob) -> dict:
+    """Describe a job for the status endpoint."""
+    return {
+        "job_id": str(job.id),
+        "city": job.city,
+        "status": job.status,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
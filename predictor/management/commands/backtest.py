@@ -0,0 +1,82 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+
+from predictor import backtest, data, forecaster, preprocess
+
+
+class Command(BaseCommand):
+    help = "Backtest the forecast engines from rolling cutoffs and compare accuracy against fit time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--city", action="append", default=[], help="City to backtest. Repeatable.")
+        parser.add_argument("--station-id", type=int, action="append", default=[], help="WAQI city ID to backtest. Repeatable.")
+        parser.add_argument("--engines", nargs="+", choices=list(forecaster.ENGINES), help="Defaults to all engines.")
+        parser.add_argument("--lookback", nargs="+", choices=preprocess.LOOKBACK_POLICIES, help=f"History policies, defaults to {preprocess.LOOKBACK}.")
+        parser.add_argument("--memory-budget", type=int, help="Bytes a fit may take, defaults to settings.TRAINING_MEMORY_BYTES.")
+        parser.add_argument("--horizon", type=int, default=backtest.HORIZON, help="Days forecast from every cutoff.")
+        parser.add_argument("--cutoffs", type=int, default=backtest.CUTOFFS, help="Cutoffs per station.")
+        parser.add_argument("--step", type=int, default=backtest.STEP, help="Days between cutoffs.")
+        parser.add_argument("--tolerance", type=float, default=backtest.TOLERANCE, help="Relative sMAPE the cheapest engine may lose.")
+        parser.add_argument("--executor", default="process", help="process, thread or serial.")
+        parser.add_argument("--output", help="Write the full report to this JSON file.")
+
+    def handle(self, *args, **options):
+        targets = [{"city_name": city} for city in options["city"]]
+        targets += [{"city_id": city_id} for city_id in options["station_id"]]
+        if not targets:
+            raise CommandError("Give at least one --city or --station-id.")
+
+        stations = []
+        for target in targets:
+            hist = data.getCityData(**target)
+            if hist == 404:
+                self.stderr.write(self.style.WARNING(f"No station found for {target}"))
+                continue
+
+            # Same data getForecastData fits on.
+            dataset = preprocess.prepare(hist[0], station_id=hist[4])
+
+            self.stdout.write(f"Backtesting {hist[2] or hist[1]} ({hist[4]}), {len(dataset.dates)} days")
+            report = backtest.compare_engines(
+                dataset,
+                engines=options["engines"],
+                lookbacks=options["lookback"],
+                memory_budget=options["memory_budget"],
+                horizon=options["horizon"],
+                cutoffs=options["cutoffs"],
+                step=options["step"],
+                executor=options["executor"],
+            )
+            for result in report:
+                self.stdout.write(
+                    f"  {result['engine']:<12} {result['lookback']:<10} sMAPE {result['smape_mean']:6.1f}%  "
+                    f"coverage {result['coverage_mean']:5.0%}  missing {result['missing_mean']:4.0%}  fit {result['fit_seconds']:7.2f}s "
+                    f"on {result['train_rows']:6.0f} rows per cutoff"
+                )
+            stations.append({"station_id": int(hist[4]), "name": hist[2], "engines": report})
+
+        if not stations:
+            raise CommandError("Nothing to backtest.")
+
+        summary = backtest.summarize([station["engines"] for station in stations])
+        best, target = backtest.cheapest(summary, options["tolerance"])
+
+        self.stdout.write(f"\n{'engine':<12} {'lookback':<10} {'sMAPE':>8} {'coverage':>9} {'missing':>8} {'fit s':>8} {'rows':>7}")
+        for row in summary:
+            self.stdout.write(
+                f"{row['engine']:<12} {row['lookback']:<10} {row['smape']:>7.1f}% {row['coverage']:>9.0%} {row['missing']:>8.0%} "
+                f"{row['fit_seconds']:>8.2f} {row['train_rows']:>7.0f}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Cheapest within sMAPE {target:.1f}%: {best['engine']} with {best['lookback']} lookback")
+        )
+
+        if options["output"]:
+            report = {
+                "options": {key: options[key] for key in ["horizon", "cutoffs", "step", "tolerance", "memory_budget"]},
+                "stations": stations,
+                "summary": summary,
+                "cheapest": {"engine": best["engine"], "lookback": best["lookback"]},
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictor import precompute
+
+
+class Command(BaseCommand):
+    help = "Precompute the forecasts of the most requested cities into the forecast cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=50, help="Number of popular cities to precompute.")
+        parser.add_argument("--workers", type=int, default=precompute.WORKERS, help="Cities computed concurrently.")
+        parser.add_argument("--city", action="append", default=[], help="Precompute this city too. Repeatable.")
+        parser.add_argument("--loop", action="store_true", help="Keep running, once a day at --at.")
+        parser.add_argument("--at", default="01:30", help="UTC time of the daily run, with --loop or from cron, after the upstream refresh. Forecasts stay cached until after the next one.")
+        parser.add_argument("--force", action="store_true", help="Run even though web workers cannot read the cache.")
+
+    def handle(self, *args, **options):
+        backend = settings.CACHES["forecasts"]["BACKEND"]
+        if backend.endswith("LocMemCache") and not options["force"]:
+            raise CommandError(
+                "The forecast cache lives in process memory, web workers would not "
+                "see these forecasts. Set FORECAST_CACHE_DIR to share them, or pass --force."
+            )
+
+        while True:
+            if options["loop"]:
+                wait = precompute.seconds_until(options["at"])
+                self.stdout.write(f"Next run in {wait / 3600:.1f} h")
+                time.sleep(wait)
+            self.run_once(options)
+            if not options["loop"]:
+                break
+
+    def run_once(self, options):
+        cities = precompute.popular_cities(options["top"])
+        cities += [city for city in options["city"] if city not in cities]
+        self.stdout.write(f"Precomputing {len(cities)} cities with {options['workers']} workers")
+
+        def progress(done, total, result):
+            line = f"[{done}/{total}] {result['city']}: {result['code']} in {result['seconds']:.1f}s"
+            if result["error"]:
+                self.stdout.write(self.style.ERROR(f"{line} ({result['error']})"))
+            else:
+                self.stdout.write(line)
+
+        # Cached until after the next daily run, which refreshes them.
+        timeout = precompute.cache_timeout(options["at"])
+        start = time.perf_counter()
+        results = precompute.precompute(cities, workers=options["workers"], progress=progress, timeout=timeout)
+        ok = sum(result["code"] == 200 for result in results)
+        self.stdout.write(
+            self.style.SUCCESS(f"{ok}/{len(results)} forecasts cached in {time.perf_counter() - start:.1f}s")
+        )
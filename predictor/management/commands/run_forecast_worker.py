@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from predictor import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued forecast jobs. Start as many workers as needed, on any node sharing the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--burst", action="store_true", help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        worker = jobs.worker_name()
+        self.stdout.write(f"Worker {worker} started")
+
+        while True:
+            close_old_connections()
+            jobs.requeue_stale()
+            job = jobs.claim_next(worker)
+            if job is None:
+                if options["burst"]:
+                    break
+                time.sleep(options["poll"])
+                continue
+
+            start = time.perf_counter()
+            job = jobs.run(job)
+            line = f"{job.id} {job.city}: {job.status} in {time.perf_counter() - start:.1f}s"
+            if job.error:
+                self.stdout.write(self.style.ERROR(f"{line} ({job.error})"))
+            else:
+                self.stdout.write(line)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from predictor import geo
+
+
+class Command(BaseCommand):
+    help = "Index the positions of the WAQI stations from the map endpoint, for lookups by location."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bounds", nargs=4, type=float, default=[-90, -180, 90, 180], metavar=("SOUTH", "WEST", "NORTH", "EAST"),
+            help="Area to index. Defaults to the whole world.",
+        )
+        parser.add_argument("--tile", type=float, default=geo.TILE_DEGREES, help="Degrees a side of every map request.")
+        parser.add_argument("--file", help="Load a saved map response instead of querying the endpoint.")
+
+    def handle(self, *args, **options):
+        if options["file"]:
+            count = geo.load_dump(options["file"])
+            self.stdout.write(self.style.SUCCESS(f"Indexed {count} stations from {options['file']}"))
+            return
+
+        from predictor import data
+
+        ozon = data.get_ozon()
+        tiles = geo.tiles(*options["bounds"], size=options["tile"])
+        stations = {}
+        for done, tile in enumerate(tiles, 1):
+            try:
+                records = ozon.get_map_stations(*tile)
+            except Exception as e:
+                self.stderr.write(self.style.WARNING(f"[{done}/{len(tiles)}] {tile}: {e}"))
+                continue
+            # Tiles share their edges, a station on one is returned twice.
+            stations.update((record["city_id"], record) for record in records)
+            self.stdout.write(f"[{done}/{len(tiles)}] {tile}: {len(records)} stations")
+
+        if not stations:
+            raise CommandError("No stations found.")
+        geo.save_stations(list(stations.values()))
+        self.stdout.write(self.style.SUCCESS(f"Indexed {len(stations)} stations"))
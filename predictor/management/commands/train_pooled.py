@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from predictor import pooled
+
+
+class Command(BaseCommand):
+    help = "Train the pooled forecast engine on the stations in the local store."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--station-id", type=int, action="append", default=[], help="Train on this station only. Repeatable.")
+        parser.add_argument("--window", type=int, default=pooled.WINDOW, help="Days of history of every forecast.")
+        parser.add_argument("--steps", type=int, default=pooled.STEPS, help="Days forecast by one pass of the model.")
+        parser.add_argument("--alpha", type=float, default=pooled.ALPHA, help="Ridge penalty.")
+
+    def handle(self, *args, **options):
+        forecaster = pooled.PooledForecaster(window=options["window"], steps=options["steps"], alpha=options["alpha"])
+
+        start = time.perf_counter()
+        try:
+            model = pooled.train(forecaster, station_ids=options["station_id"] or None)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        pollutants = sorted(col for col in model.models_ if col != pooled.POLLUTANT)
+        self.stdout.write(f"{model.windows_} windows of {model.stations_} stations, own models for {', '.join(pollutants) or 'no pollutant'}")
+        self.stdout.write(self.style.SUCCESS(f"Trained in {time.perf_counter() - start:.1f}s"))
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Observation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('station_id', models.IntegerField()),
+                ('pollutant', models.CharField(max_length=16)),
+                ('date', models.DateField()),
+                ('value', models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Station',
+            fields=[
+                ('station_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('pollutants', models.JSONField(default=list)),
+                ('last_date', models.DateField(null=True)),
+                ('last_synced', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='observation',
+            constraint=models.UniqueConstraint(fields=('station_id', 'pollutant', 'date'), name='unique_station_pollutant_date'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictor', '0002_station_search_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProphetFit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('station_id', models.IntegerField()),
+                ('pollutant', models.CharField(max_length=16)),
+                ('params', models.JSONField()),
+                ('cold_seconds', models.FloatField(null=True)),
+                ('warm_seconds', models.FloatField(null=True)),
+                ('fitted_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='prophetfit',
+            constraint=models.UniqueConstraint(fields=('station_id', 'pollutant'), name='unique_prophet_fit_station_pollutant'),
+        ),
+    ]
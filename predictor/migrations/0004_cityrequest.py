@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictor', '0003_prophetfit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CityRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('query', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('last_requested', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
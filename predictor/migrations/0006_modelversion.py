@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictor', '0005_forecastjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('station_id', models.IntegerField()),
+                ('pollutant', models.CharField(max_length=16)),
+                ('version', models.PositiveIntegerField()),
+                ('data_hash', models.CharField(max_length=40)),
+                ('config_hash', models.CharField(max_length=16)),
+                ('config', models.JSONField(default=dict)),
+                ('path', models.CharField(max_length=255)),
+                ('size_bytes', models.BigIntegerField()),
+                ('fit_seconds', models.FloatField(null=True)),
+                ('fitted_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['station_id', 'pollutant', 'data_hash', 'config_hash'], name='predictor_m_station_30ca0c_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='modelversion',
+            constraint=models.UniqueConstraint(fields=('station_id', 'pollutant', 'version'), name='unique_model_version'),
+        ),
+    ]
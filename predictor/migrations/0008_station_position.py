@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictor', '0007_flight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='station',
+            name='lon',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
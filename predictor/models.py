@@ -0,0 +1,201 @@
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class Station(models.Model):
+    """Sync state of a WAQI station whose history is kept locally.
+
+    Attributes:
+        station_id (int): The WAQI city ID of the station.
+        name (str): The station name returned by the station search.
+        country_code (str): The country code returned by the station search.
+        url (str): The station url returned by the station search.
+        score (float): The search score of the station.
+        pollutants (list): The station's columns, in the order the backend sorts them.
+        last_date (date): The most recent day stored for the station.
+        last_synced (datetime): When the history was last fetched from the backend.
+        lat (float): Latitude returned by the map endpoint, see predictor.geo.
+        lon (float): Longitude returned by the map endpoint.
+    """
+
+    station_id = models.IntegerField(primary_key=True)
+    name = models.CharField(max_length=255, blank=True)
+    country_code = models.CharField(max_length=8, blank=True)
+    url = models.CharField(max_length=255, blank=True)
+    score = models.FloatField(default=0)
+    pollutants = models.JSONField(default=list)
+    last_date = models.DateField(null=True)
+    last_synced = models.DateTimeField(null=True)
+    lat = models.FloatField(null=True, blank=True)
+    lon = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.station_id)
+
+
+class Observation(models.Model):
+    """Daily reading of one pollutant at one station."""
+
+    station_id = models.IntegerField()
+    pollutant = models.CharField(max_length=16)
+    date = models.DateField()
+    value = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["station_id", "pollutant", "date"],
+                name="unique_station_pollutant_date",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.station_id} {self.pollutant} {self.date}"
+
+
+class ProphetFit(models.Model):
+    """Latest fitted Prophet parameters of one pollutant at one station.
+
+    Attributes:
+        params (dict): The MAP estimates k, m, sigma_obs, delta and beta, used
+            to warm start the next fit.
+        cold_seconds (float): Duration of the latest fit from Prophet's default start.
+        warm_seconds (float): Duration of the latest fit started from params.
+    """
+
+    station_id = models.IntegerField()
+    pollutant = models.CharField(max_length=16)
+    params = models.JSONField()
+    cold_seconds = models.FloatField(null=True)
+    warm_seconds = models.FloatField(null=True)
+    fitted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["station_id", "pollutant"],
+                name="unique_prophet_fit_station_pollutant",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.station_id} {self.pollutant}"
+
+
+class CityRequest(models.Model):
+    """How often a city was searched, to pick the forecasts worth precomputing.
+
+    Attributes:
+        name (str): The normalized search key, see predictor.search.normalize_city.
+        query (str): The search key as last typed by a user.
+        count (int): Number of forecast requests for the city.
+        last_requested (datetime): When the city was last requested.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    query = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+    last_requested = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.query
+
+
+class ForecastJob(models.Model):
+    """Forecast request queued for the worker processes.
+
+    Attributes:
+        city (str): The search key of the city to forecast.
+        status (str): One of the STATUS_CHOICES.
+        result (dict): The getForecastData output, once done.
+        error (str): Why the job failed.
+        worker (str): The worker that claimed the job.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    city = models.CharField(max_length=255)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    result = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"{self.city} ({self.status})"
+
+
+class ModelVersion(models.Model):
+    """Fitted forecaster of one pollutant at one station, stored on disk.
+
+    Attributes:
+        version (int): Increases with every fit of the station's pollutant.
+        data_hash (str): Digest of the training series, see registry.data_hash.
+        config_hash (str): Digest of the forecaster's parameters.
+        config (dict): The forecaster's parameters.
+        path (str): The pickled forecaster, relative to MODEL_REGISTRY_DIR.
+        size_bytes (int): Size of the pickled forecaster.
+        fit_seconds (float): How long the fit took.
+        last_used (datetime): When the model was last saved or loaded.
+    """
+
+    station_id = models.IntegerField()
+    pollutant = models.CharField(max_length=16)
+    version = models.PositiveIntegerField()
+    data_hash = models.CharField(max_length=40)
+    config_hash = models.CharField(max_length=16)
+    config = models.JSONField(default=dict)
+    path = models.CharField(max_length=255)
+    size_bytes = models.BigIntegerField()
+    fit_seconds = models.FloatField(null=True)
+    fitted_at = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["station_id", "pollutant", "version"],
+                name="unique_model_version",
+            )
+        ]
+        indexes = [models.Index(fields=["station_id", "pollutant", "data_hash", "config_hash"])]
+
+    def __str__(self):
+        return f"{self.station_id} {self.pollutant} v{self.version}"
+
+
+class Flight(models.Model):
+    """Work in progress for a key, shared by the workers, see predictor.singleflight.
+
+    Attributes:
+        key (str): What is being computed, e.g. a forecast cache key.
+        owner (str): The worker doing the work.
+        expires_at (datetime): When other workers may take over, should the
+            owner have died.
+        error (str): Why the work failed, kept briefly for the waiting workers.
+    """
+
+    key = models.CharField(max_length=255, unique=True)
+    owner = models.CharField(max_length=255)
+    expires_at = models.DateTimeField()
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.key
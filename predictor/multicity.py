@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from django.db import close_old_connections
+
+
+# Cities fetched and forecast concurrently by one batch. Downloads share the
+# client's connection pool and fits share forecaster.get_executor(), so this
+# mostly bounds how many downloads are in flight.
+CITY_WORKERS: int = 8
+
+# Largest number of cities a single batch may ask for.
+MAX_CITIES: int = 50
+
+
+def forecast_one(
+    city: Optional[str] = None, city_id: Optional[int] = None, **options
+) -> Dict[str, Any]:
+    """Fetch and forecast one city or station, turning failures into an error entry.
+
+    options are passed on to forecaster.getForecastData.
+    """
+    from . import data, forecaster, singleflight
+
+    close_old_connections()
+    try:
+        hist = data.getCityData(city_name=city, city_id=city_id)
+        return forecaster.getForecastData(data=hist, **options)
+    except (singleflight.FlightError, singleflight.FlightTimeout) as e:
+        # Another worker failed or is still busy with the same city.
+        return {"code": 503, "error": str(e)}
+    except Exception as e:
+        return {"code": 500, "error": str(e)}
+    finally:
+        close_old_connections()
+
+
+def forecast_many(
+    cities: List[str] = (), station_ids: List[int] = (), workers: int = CITY_WORKERS, **options
+) -> Dict[str, Dict[str, Any]]:
+    """Forecast several cities and stations concurrently.
+
+    Args:
+        cities (List[str], optional): Search keys of cities.
+        station_ids (List[int], optional): WAQI city IDs of stations.
+        workers (int, optional): Cities handled at once. Defaults to CITY_WORKERS.
+        **options: Passed on to forecaster.getForecastData, e.g. columnar.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The getForecastData output of every city and
+            station, keyed by the search key or the station id as a string. A
+            city that failed gets {"code": 500, "error": ...} instead, with 503
+            when another worker failed or is still busy with it.
+    """
+    requests = [(city, {"city": city}) for city in cities]
+    requests += [(str(city_id), {"city_id": int(city_id)}) for city_id in station_ids]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(key, pool.submit(forecast_one, **kwargs, **options)) for key, kwargs in requests]
+        return {key: future.result() for key, future in futures}
@@ -0,0 +1,287 @@
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy
+import pandas
+
+from . import preprocess, registry, singleflight, store
+from .batch import _fill_ends
+from .cache import config_hash
+from .models import Observation
+
+# Days of history every forecast is made from.
+WINDOW: int = 28
+
+# Days forecast by one pass of the model. Longer horizons feed the forecast
+# back in as history.
+STEPS: int = 30
+
+# Ridge penalty on the feature weights.
+ALPHA: float = 1.0
+
+# Training windows taken from every series, evenly spaced, so that long
+# histories do not outweigh the other stations.
+MAX_WINDOWS: int = 400
+
+# Windows a pollutant needs for a model of its own. The others are forecast
+# by the model of all pollutants.
+MIN_WINDOWS: int = 200
+
+# Quantile levels of the training residuals kept for the prediction intervals.
+LEVELS = numpy.linspace(0.01, 0.99, 99)
+
+# Registry key of the trained model, which belongs to no station. Its latest
+# version is never evicted from the registry.
+STATION_ID: int = registry.PINNED_STATION_ID
+POLLUTANT: str = "*"
+
+# Models loaded in this process, by configuration hash, with their version.
+_models: Dict[str, Tuple[Optional[int], "PooledForecaster"]] = {}
+_models_lock = threading.Lock()
+
+
+class PooledForecaster:
+    """Forecaster of any station and pollutant, trained on all of them at once.
+
+    Forecasting is reduced to regression. Every example is a window of
+    history of one pollutant at one station, divided by its mean, with the
+    log of that mean and the weekday and season of its last day. The targets
+    are the next days on the same scale. A ridge regression, solved in closed
+    form, predicts all of them at once: one per pollutant with enough
+    windows, and one over all pollutants for the others.
+
+    Unlike the other engines it is trained beforehand, see train(), and
+    forecasting a station takes its last days and a matrix product.
+
+    Attributes:
+        window (int): Days of history of every forecast.
+        steps (int): Days forecast by one pass.
+        alpha (float): Ridge penalty.
+    """
+
+    def __init__(self, window: int = WINDOW, steps: int = STEPS, alpha: float = ALPHA):
+        self.window = window
+        self.steps = steps
+        self.alpha = alpha
+
+    def get_params(self) -> Dict[str, Any]:
+        """Return the configuration, like sktime forecasters do."""
+        return {"engine": "pooled", "window": self.window, "steps": self.steps, "alpha": self.alpha}
+
+    def clone(self) -> "PooledForecaster":
+        """Return an unfitted copy with the same configuration."""
+        return PooledForecaster(window=self.window, steps=self.steps, alpha=self.alpha)
+
+    def fit(self, frames: Iterable[pandas.DataFrame]) -> "PooledForecaster":
+        """Fit on the series of many stations.
+
+        Args:
+            frames (Iterable[pandas.DataFrame]): Daily data of every station,
+                oldest first, one column per pollutant, like
+                preprocess.Prepared.frame returns it.
+
+        Returns:
+            PooledForecaster: The fitted forecaster.
+        """
+        examples: Dict[str, List[Tuple[numpy.ndarray, numpy.ndarray]]] = {}
+        stations = 0
+        for frame in frames:
+            values = frame.to_numpy(dtype=numpy.float64)
+            for i, col in enumerate(frame.columns):
+                X, Y = self._examples(values[:, i], frame.index)
+                if len(X):
+                    examples.setdefault(col, []).append((X, Y))
+            stations += 1
+
+        if not examples:
+            raise ValueError(f"No series is long enough to fit, {self.window + self.steps} days are needed.")
+
+        self.models_ = {}
+        for col, parts in examples.items():
+            X = numpy.vstack([X for X, _ in parts])
+            if len(X) >= MIN_WINDOWS:
+                self.models_[col] = _ridge(X, numpy.vstack([Y for _, Y in parts]), self.alpha)
+        parts = [part for col_parts in examples.values() for part in col_parts]
+        X, Y = numpy.vstack([X for X, _ in parts]), numpy.vstack([Y for _, Y in parts])
+        self.models_[POLLUTANT] = _ridge(X, Y, self.alpha)
+
+        self.stations_ = stations
+        self.windows_ = len(X)
+        return self
+
+    def predict(
+        self, frame: pandas.DataFrame, steps: numpy.ndarray, confidence: float = 0.9
+    ) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """Forecast every column of a station from its last days.
+
+        Args:
+            frame (pandas.DataFrame): Daily data of the station, oldest first,
+                one column per pollutant. Only the last window days are used.
+            steps (numpy.ndarray): Days ahead of the last one of frame, 1 being
+                the next one.
+            confidence (float, optional): Coverage of the prediction interval.
+                Defaults to 0.9.
+
+        Returns:
+            Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]: The forecast and
+                the lower and upper interval bounds, each of shape
+                (steps, columns). Columns without any data are nan.
+        """
+        values = frame.to_numpy(dtype=numpy.float64)[-self.window :]
+        if len(values) < self.window:
+            padding = numpy.full((self.window - len(values), values.shape[1]), numpy.nan)
+            values = numpy.vstack([padding, values])
+        empty = numpy.isnan(values).all(axis=0)
+        history = _fill_ends(values).T
+
+        low = numpy.abs(LEVELS - (1 - confidence) / 2).argmin()
+        high = numpy.abs(LEVELS - (1 + confidence) / 2).argmin()
+        models = [self.models_.get(col, self.models_[POLLUTANT]) for col in frame.columns]
+
+        # The intervals of later passes reuse those of the first.
+        means, lowers, uppers = [], [], []
+        last_day = frame.index[-1]
+        passes = int(numpy.ceil(numpy.max(steps) / self.steps))
+        for _ in range(passes):
+            X, scale = self._features(history, pandas.DatetimeIndex([last_day] * len(history)))
+            mean, lower, upper = (numpy.empty((len(history), self.steps)) for _ in range(3))
+            for i, model in enumerate(models):
+                mean[i] = X[i] @ model["weights"] + model["intercept"]
+                lower[i] = mean[i] + model["residuals"][low]
+                upper[i] = mean[i] + model["residuals"][high]
+            mean, lower, upper = (block * scale[:, None] for block in (mean, lower, upper))
+            means.append(mean)
+            lowers.append(lower)
+            uppers.append(upper)
+
+            history = numpy.hstack([history, mean])[:, -self.window :]
+            last_day += pandas.Timedelta(days=self.steps)
+
+        positions = numpy.asarray(steps) - 1
+        result = []
+        for blocks in (means, lowers, uppers):
+            block = numpy.hstack(blocks)[:, positions].T
+            block[:, empty] = numpy.nan
+            result.append(block)
+        return tuple(result)
+
+    def _examples(self, y: numpy.ndarray, dates: pandas.DatetimeIndex) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Features and scaled targets of the complete windows of a series."""
+        span = self.window + self.steps
+        if len(y) < span:
+            return numpy.empty((0, 0)), numpy.empty((0, 0))
+
+        windows = numpy.lib.stride_tricks.sliding_window_view(y, span)
+        starts = numpy.flatnonzero(~numpy.isnan(windows).any(axis=1))
+        if len(starts) > MAX_WINDOWS:
+            starts = starts[numpy.linspace(0, len(starts) - 1, MAX_WINDOWS).astype(int)]
+        windows = windows[starts]
+
+        X, scale = self._features(windows[:, : self.window], dates[starts + self.window - 1])
+        return X, windows[:, self.window :] / scale[:, None]
+
+    def _features(self, history: numpy.ndarray, last_days: pandas.DatetimeIndex) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Features of windows of history, each row a window, and their scale."""
+        scale = numpy.abs(history).mean(axis=1)
+        scale[~(scale > 0)] = 1.0
+        angle = 2 * numpy.pi * last_days.dayofyear.to_numpy() / 365.25
+        X = numpy.hstack(
+            [
+                history / scale[:, None],
+                numpy.log(scale)[:, None],
+                numpy.eye(7)[last_days.dayofweek.to_numpy()],
+                numpy.sin(angle)[:, None],
+                numpy.cos(angle)[:, None],
+            ]
+        )
+        return X, scale
+
+
+def _ridge(X: numpy.ndarray, Y: numpy.ndarray, alpha: float) -> Dict[str, numpy.ndarray]:
+    """Ridge regression of every column of Y on X, with an unpenalized intercept.
+
+    Returns:
+        Dict[str, numpy.ndarray]: The weights, the intercept and the LEVELS
+            quantiles of the training residuals of every column of Y.
+    """
+    x_mean, y_mean = X.mean(axis=0), Y.mean(axis=0)
+    Xc = X - x_mean
+    weights = numpy.linalg.solve(Xc.T @ Xc + alpha * numpy.eye(X.shape[1]), Xc.T @ (Y - y_mean))
+    intercept = y_mean - x_mean @ weights
+    residuals = Y - (X @ weights + intercept)
+    return {
+        "weights": weights,
+        "intercept": intercept,
+        "residuals": numpy.quantile(residuals, LEVELS, axis=0),
+    }
+
+
+def train(forecaster: Optional[PooledForecaster] = None, station_ids: Optional[List[int]] = None) -> PooledForecaster:
+    """Train the pooled model on the stations in the local store and register it.
+
+    Args:
+        forecaster (PooledForecaster, optional): The configuration to train.
+            Defaults to the default one.
+        station_ids (List[int], optional): Stations to train on. Defaults to
+            every station with stored observations.
+
+    Returns:
+        PooledForecaster: The trained forecaster.
+    """
+    forecaster = (forecaster or PooledForecaster()).clone()
+    if station_ids is None:
+        station_ids = sorted(Observation.objects.values_list("station_id", flat=True).distinct())
+
+    frames, digest = [], hashlib.sha1()
+    for station_id in station_ids:
+        frame = store.load_station(station_id)
+        if frame.empty:
+            continue
+        # Same column names as data.get_historical_data gives the forecasts.
+        frame = frame.rename(columns={"pm25": "pm2.5"})
+        frames.append(preprocess.prepare(frame, station_id=station_id).frame())
+        digest.update(f"{station_id}:{frame.index.max()};".encode())
+
+    start = time.perf_counter()
+    forecaster.fit(frames)
+    seconds = time.perf_counter() - start
+
+    config = forecaster.get_params()
+    registry.save(STATION_ID, POLLUTANT, forecaster, digest.hexdigest(), config, seconds)
+    return forecaster
+
+
+def trained(forecaster: PooledForecaster) -> PooledForecaster:
+    """Return the registered model with the configuration of forecaster.
+
+    The model is kept in the process until a newer version is registered.
+    If none was trained yet, one is trained on the local store first. Train
+    it again regularly with the train_pooled command.
+    """
+    config = forecaster.get_params()
+    key = config_hash(config)
+    version = registry.latest_version(STATION_ID, POLLUTANT, config)
+    with _models_lock:
+        loaded = _models.get(key)
+    if loaded is not None and version is not None and loaded[0] == version:
+        return loaded[1]
+
+    model = registry.latest(STATION_ID, POLLUTANT, config) if version is not None else None
+    if model is None:
+        model = singleflight.do(
+            f"pooled:{key}",
+            lambda: registry.latest(STATION_ID, POLLUTANT, config) or train(forecaster),
+        )
+        # Labelled with the version before a newer one could be registered,
+        # at worst it is loaded again once.
+        version = registry.latest_version(STATION_ID, POLLUTANT, config)
+    with _models_lock:
+        _models[key] = (version, model)
+    return model
+
+
+def model_version(forecaster: PooledForecaster) -> Optional[int]:
+    """Return the registry version of the model trained() uses, None before the first training."""
+    return registry.latest_version(STATION_ID, POLLUTANT, forecaster.get_params())
@@ -0,0 +1,111 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CityRequest
+from .search import normalize_city
+
+# Only cities requested within this window count as popular.
+POPULAR_WINDOW: timedelta = timedelta(days=7)
+
+# Precomputed forecasts stay cached this long after the next scheduled run,
+# which replaces them before they expire.
+TTL_MARGIN: timedelta = timedelta(hours=2)
+
+# Cities precomputed concurrently. Each city already fits its pollutants in
+# parallel, see forecaster.MAX_WORKERS.
+WORKERS: int = 2
+
+
+def record_request(city: str) -> None:
+    """Count a forecast request for city."""
+    name = normalize_city(city)
+    if not name:
+        return
+    updated = CityRequest.objects.filter(name=name).update(
+        count=F("count") + 1, query=city.strip(), last_requested=timezone.now()
+    )
+    if not updated:
+        CityRequest.objects.get_or_create(name=name, defaults={"query": city.strip(), "count": 1})
+
+
+def popular_cities(limit: int) -> List[str]:
+    """Return the search keys of the most requested cities of the last POPULAR_WINDOW."""
+    since = timezone.now() - POPULAR_WINDOW
+    requests = CityRequest.objects.filter(last_requested__gte=since).order_by("-count")
+    return list(requests.values_list("query", flat=True)[:limit])
+
+
+def precompute_city(city: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Fetch and forecast a city, leaving the result in the forecast cache.
+
+    Args:
+        city (str): Search key of the city.
+        timeout (float, optional): Seconds the forecast stays cached, see
+            forecaster.getForecastData.
+
+    Returns:
+        Dict[str, Any]: The city, the response code and the seconds it took.
+    """
+    from . import data, forecaster
+
+    close_old_connections()
+    start = time.perf_counter()
+    try:
+        hist = data.getCityData(city_name=city)
+        code = forecaster.getForecastData(data=hist, cache_timeout=timeout)["code"]
+        error = None
+    except Exception as e:
+        code, error = 500, str(e)
+    finally:
+        close_old_connections()
+    return {"city": city, "code": code, "seconds": time.perf_counter() - start, "error": error}
+
+
+def precompute(
+    cities: List[str],
+    workers: int = WORKERS,
+    progress: Optional[Callable[[int, int, Dict[str, Any]], None]] = None,
+    timeout: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """Precompute the forecasts of cities with a bounded pool of threads.
+
+    Args:
+        cities (List[str]): Search keys of the cities.
+        workers (int, optional): Cities computed concurrently. Defaults to WORKERS.
+        progress (Callable, optional): Called with the number of cities done,
+            the total and the result of every city as it finishes.
+        timeout (float, optional): Seconds the forecasts stay cached, e.g.
+            until after the next run, see cache_timeout.
+
+    Returns:
+        List[Dict[str, Any]]: The result of every city, see precompute_city.
+    """
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(precompute_city, city, timeout) for city in cities]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if progress is not None:
+                progress(len(results), len(cities), results[-1])
+    return results
+
+
+def seconds_until(at: str, now: Optional[datetime] = None) -> float:
+    """Seconds from now until the next time the clock shows at ("HH:MM", UTC)."""
+    now = now or timezone.now()
+    hour, minute = (int(part) for part in at.split(":"))
+    run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run <= now:
+        run += timedelta(days=1)
+    return (run - now).total_seconds()
+
+
+def cache_timeout(at: str, now: Optional[datetime] = None) -> float:
+    """Seconds precomputed forecasts are cached, until TTL_MARGIN after the next run at ("HH:MM", UTC)."""
+    return seconds_until(at, now) + TTL_MARGIN.total_seconds()
@@ -0,0 +1,225 @@
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy
+import pandas
+from django.conf import settings
+
+# Prepared stations kept in this process, by station, data date and day.
+CACHE_SIZE: int = 64
+
+# History a forecaster is fitted on, see bound() and settings.TRAINING_LOOKBACK.
+LOOKBACK_POLICIES: Tuple[str, ...] = ("full", "window", "seasons", "downsample")
+LOOKBACK: str = getattr(settings, "TRAINING_LOOKBACK", "full")
+
+# Days kept by the "window" policy.
+WINDOW_DAYS: int = 365
+
+# Cycles of the longest seasonality of the forecaster kept by "seasons".
+SEASONS: int = 3
+
+# Days kept daily by "downsample", the history before them is averaged by week.
+RECENT_DAYS: int = 365
+DOWNSAMPLE_RULE: str = "7D"
+
+# Fewest days any policy or budget keeps.
+MIN_DAYS: int = 90
+
+# Bytes a fit may take per request, see settings.TRAINING_MEMORY_BYTES. 0
+# means no limit.
+MEMORY_BUDGET: int = getattr(settings, "TRAINING_MEMORY_BYTES", 0)
+
+_cache: "OrderedDict[Tuple[Any, ...], Prepared]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class Prepared:
+    """Training data of a station, one clean daily array per pollutant.
+
+    Attributes:
+        dates (pandas.DatetimeIndex): Consecutive days, oldest first, up to
+            the last day of the data that is not in the future.
+        columns (List[str]): The pollutants.
+        values (numpy.ndarray): Read-only float32 array of shape (dates,
+            columns). Gaps inside a column are interpolated linearly, days
+            before its first or after its last reading are nan.
+        present_day (Dict[str, float]): Readings of the last day, by
+            pollutant, skipping the missing ones.
+    """
+
+    def __init__(self, dates, columns, values, present_day):
+        self.dates: pandas.DatetimeIndex = dates
+        self.columns: List[str] = columns
+        self.values: numpy.ndarray = values
+        self.present_day: Dict[str, float] = present_day
+
+    @property
+    def last_date(self) -> Optional[pandas.Timestamp]:
+        """The last day, None without any data."""
+        return self.dates[-1] if len(self.dates) else None
+
+    def frame(self) -> pandas.DataFrame:
+        """The values as a daily DataFrame, a copy the caller may modify."""
+        return pandas.DataFrame(self.values.copy(), index=self.dates, columns=self.columns)
+
+
+def prepare(frame: pandas.DataFrame, station_id: Optional[int] = None, today: Optional[date] = None) -> Prepared:
+    """Turn a decoded station frame into the daily arrays the forecasters fit on.
+
+    Days after today are dropped, the rest is laid out on a day grid and the
+    gaps of every column are interpolated on their own, all with array
+    operations over the whole frame. A row is never dropped because another
+    pollutant is missing on that day.
+
+    Args:
+        frame (pandas.DataFrame): Readings with a datetime index, one column
+            per pollutant, in any order, e.g. from data.getCityData.
+        station_id (int, optional): The WAQI city ID of the station. When
+            given, the result is cached by station, last date of frame and
+            today.
+        today (date, optional): Last day that is not in the future. Defaults
+            to the current date.
+
+    Returns:
+        Prepared: The training data.
+    """
+    today = today or datetime.now().date()
+    if station_id is None or frame.empty:
+        return _prepare(frame, today)
+
+    key = (int(station_id), frame.index.max(), tuple(frame.columns), today)
+    with _cache_lock:
+        prepared = _cache.get(key)
+        if prepared is not None:
+            _cache.move_to_end(key)
+            return prepared
+
+    prepared = _prepare(frame, today)
+    with _cache_lock:
+        _cache[key] = prepared
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return prepared
+
+
+def _prepare(frame: pandas.DataFrame, today: date) -> Prepared:
+    columns = list(frame.columns)
+    if frame.empty:
+        return _empty(columns)
+    days = frame.index.normalize()
+    past = days <= pandas.Timestamp(today)
+    if not past.any():
+        return _empty(columns)
+
+    days = days[past]
+    raw = frame.to_numpy(dtype=numpy.float64)[past]
+
+    # Every reading goes to the row of its day, missing days stay nan.
+    first = days.min()
+    rows = ((days - first) // pandas.Timedelta(days=1)).to_numpy()
+    grid = numpy.full((rows.max() + 1, len(columns)), numpy.nan)
+    grid[rows] = raw
+
+    # Raw readings of the last day, before any interpolation.
+    last = grid[-1]
+    present_day = {col: float(last[i]) for i, col in enumerate(columns) if not numpy.isnan(last[i])}
+
+    values = interpolate_inner(grid).astype(numpy.float32)
+    values.flags.writeable = False
+    dates = pandas.date_range(first, periods=len(grid), freq="D")
+    return Prepared(dates, columns, values, present_day)
+
+
+def _empty(columns: List[str]) -> Prepared:
+    return Prepared(pandas.DatetimeIndex([], freq="D"), columns, numpy.empty((0, len(columns)), dtype=numpy.float32), {})
+
+
+def interpolate_inner(values: numpy.ndarray) -> numpy.ndarray:
+    """Interpolate the nan between the readings of every column linearly.
+
+    Leading and trailing nan are kept, a column is never extended past its
+    first or last reading.
+
+    Args:
+        values (numpy.ndarray): Array of shape (rows, columns), evenly spaced
+            rows.
+
+    Returns:
+        numpy.ndarray: A float64 copy with the inner gaps filled.
+    """
+    values = numpy.array(values, dtype=numpy.float64)
+    n = len(values)
+    valid = ~numpy.isnan(values)
+    rows = numpy.arange(n)[:, None]
+
+    # Row of the previous and of the next reading, for every cell.
+    before = numpy.maximum.accumulate(numpy.where(valid, rows, -1), axis=0)
+    after = numpy.minimum.accumulate(numpy.where(valid, rows, n)[::-1], axis=0)[::-1]
+
+    inner = ~valid & (before >= 0) & (after < n)
+    row, col = numpy.nonzero(inner)
+    start, end = before[inner], after[inner]
+    weight = (row - start) / (end - start)
+    values[inner] = values[start, col] + weight * (values[end, col] - values[start, col])
+    return values
+
+
+def bound(
+    frame: pandas.DataFrame,
+    policy: str = LOOKBACK,
+    period: int = 365,
+    regular: bool = False,
+    row_bytes: int = 0,
+    budget: int = MEMORY_BUDGET,
+) -> pandas.DataFrame:
+    """Cut the history a forecaster is fitted on to a lookback policy and a memory budget.
+
+    Policies:
+        full: All of it.
+        window: The last WINDOW_DAYS days.
+        seasons: SEASONS cycles of the seasonal period.
+        downsample: The last RECENT_DAYS days, and weekly means of the days
+            before them.
+
+    The budget then keeps as many of the latest rows as it pays for, never
+    fewer than MIN_DAYS.
+
+    Args:
+        frame (pandas.DataFrame): Daily training data, oldest first, e.g.
+            from Prepared.frame.
+        policy (str, optional): One of LOOKBACK_POLICIES. Defaults to LOOKBACK.
+        period (int, optional): Longest seasonal period of the forecaster, in
+            days. Defaults to a year.
+        regular (bool, optional): The forecaster needs evenly spaced rows, so
+            "downsample" keeps its daily rows only. Defaults to False.
+        row_bytes (int, optional): Memory a fit takes per row and column.
+        budget (int, optional): Memory the fit may take, 0 for no limit.
+            Defaults to MEMORY_BUDGET.
+
+    Returns:
+        pandas.DataFrame: The rows kept, as float32.
+    """
+    if policy not in LOOKBACK_POLICIES:
+        raise ValueError(f"Unknown lookback policy {policy!r}, use one of {', '.join(LOOKBACK_POLICIES)}.")
+
+    rows = len(frame)
+    if policy == "window":
+        rows = WINDOW_DAYS
+    elif policy == "seasons":
+        rows = SEASONS * period
+    elif policy == "downsample":
+        rows = RECENT_DAYS
+
+    bounded = frame.iloc[-max(rows, MIN_DAYS) :]
+    if policy == "downsample" and not regular and len(bounded) < len(frame):
+        # Weeks are labelled with their last day, all before the daily rows.
+        distant = frame.iloc[: len(frame) - len(bounded)]
+        weekly = distant.resample(DOWNSAMPLE_RULE, origin="end", closed="right", label="right").mean()
+        bounded = pandas.concat([weekly.dropna(how="all"), bounded])
+
+    if budget and row_bytes:
+        affordable = budget // (row_bytes * max(frame.shape[1], 1))
+        bounded = bounded.iloc[-max(affordable, MIN_DAYS) :]
+    return bounded.astype(numpy.float32, copy=False)
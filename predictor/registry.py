@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import pickle
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+import pandas
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .cache import config_hash
+from .models import ModelVersion
+
+# Directory holding the pickled models, see settings.MODEL_REGISTRY_DIR.
+REGISTRY_DIR: str = getattr(settings, "MODEL_REGISTRY_DIR", "models")
+
+# Disk space the models may take before the least recently used are evicted.
+MAX_BYTES: int = getattr(settings, "MODEL_REGISTRY_MAX_BYTES", 256 * 1024 * 1024)
+
+# Station ID whose latest models are never evicted: the pooled model, which
+# belongs to no station and is only trained by train_pooled, see
+# predictor.pooled.
+PINNED_STATION_ID: int = 0
+
+
+def data_hash(y: pandas.Series) -> str:
+    """Digest of a training series: its first and last dates, its length and its last value.
+
+    The store only rewrites the last day of a station, so these tell a new
+    training series from an old one without reading all of it, whatever the
+    lookback cut.
+    """
+    parts = [len(y)]
+    if len(y):
+        parts += [y.index[0].isoformat(), y.index[-1].isoformat(), repr(float(y.iloc[-1]))]
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+def load(station_id: int, pollutant: str, y_hash: str, config: Dict[str, Any]) -> Optional[Any]:
+    """Return the latest model fitted on the same data with the same config.
+
+    Args:
+        station_id (int): The WAQI city ID of the station.
+        pollutant (str): The fitted column.
+        y_hash (str): data_hash of the training series.
+        config (Dict[str, Any]): Parameters of the forecaster.
+
+    Returns:
+        Optional[Any]: The fitted forecaster, or None if there is none.
+    """
+    entry = (
+        ModelVersion.objects.filter(
+            station_id=station_id,
+            pollutant=pollutant,
+            data_hash=y_hash,
+            config_hash=config_hash(config),
+        )
+        .order_by("-version")
+        .first()
+    )
+    return _read(entry)
+
+
+def latest(station_id: int, pollutant: str, config: Dict[str, Any], max_age: Optional[timedelta] = None) -> Optional[Any]:
+    """Return the latest model with the same config, whatever data it was fitted on.
+
+    Args:
+        station_id (int): The WAQI city ID of the station.
+        pollutant (str): The fitted column.
+        config (Dict[str, Any]): Parameters of the forecaster.
+        max_age (timedelta, optional): Ignore models fitted longer ago.
+
+    Returns:
+        Optional[Any]: The fitted forecaster, or None if there is none.
+    """
+    entries = ModelVersion.objects.filter(
+        station_id=station_id, pollutant=pollutant, config_hash=config_hash(config)
+    )
+    if max_age is not None:
+        entries = entries.filter(fitted_at__gte=timezone.now() - max_age)
+    return _read(entries.order_by("-version").first())
+
+
+def latest_version(station_id: int, pollutant: str, config: Dict[str, Any]) -> Optional[int]:
+    """Return the version of the model latest() would load, without loading it.
+
+    Returns:
+        Optional[int]: The version, or None if there is no model.
+    """
+    return (
+        ModelVersion.objects.filter(station_id=station_id, pollutant=pollutant, config_hash=config_hash(config))
+        .order_by("-version")
+        .values_list("version", flat=True)
+        .first()
+    )
+
+
+def _read(entry: Optional[ModelVersion]) -> Optional[Any]:
+    """Unpickle the model of a registry entry and mark it as used."""
+    if entry is None:
+        return None
+
+    try:
+        # Only files written by save() are ever read.
+        with open(os.path.join(REGISTRY_DIR, entry.path), "rb") as f:
+            forecaster = pickle.load(f)
+    except Exception:
+        # Deleted by another process, or pickled by other library versions.
+        entry.delete()
+        return None
+
+    ModelVersion.objects.filter(pk=entry.pk).update(last_used=timezone.now())
+    return forecaster
+
+
+def save(
+    station_id: int,
+    pollutant: str,
+    forecaster: Any,
+    y_hash: str,
+    config: Dict[str, Any],
+    seconds: Optional[float] = None,
+) -> ModelVersion:
+    """Store a fitted forecaster as the next version, then evict down to MAX_BYTES.
+
+    Args:
+        station_id (int): The WAQI city ID of the station.
+        pollutant (str): The fitted column.
+        forecaster (Any): The fitted forecaster, it must pickle.
+        y_hash (str): data_hash of the training series.
+        config (Dict[str, Any]): Parameters of the forecaster.
+        seconds (float, optional): How long the fit took.
+
+    Returns:
+        ModelVersion: The registry entry.
+    """
+    path = os.path.join(str(station_id), f"{uuid.uuid4().hex}.pkl")
+    full_path = os.path.join(REGISTRY_DIR, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    # Written under a temporary name, so readers never see a partial file.
+    tmp_path = f"{full_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(forecaster, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, full_path)
+
+    versions = ModelVersion.objects.filter(station_id=station_id, pollutant=pollutant)
+    while True:
+        latest = versions.aggregate(latest=Max("version"))["latest"] or 0
+        try:
+            with transaction.atomic():
+                entry = ModelVersion.objects.create(
+                    station_id=station_id,
+                    pollutant=pollutant,
+                    version=latest + 1,
+                    data_hash=y_hash,
+                    config_hash=config_hash(config),
+                    config=json.loads(json.dumps(config, default=str)),
+                    path=path,
+                    size_bytes=os.path.getsize(full_path),
+                    fit_seconds=seconds,
+                    last_used=timezone.now(),
+                )
+            break
+        except IntegrityError:
+            # Another process registered the same version first.
+            continue
+
+    evict()
+    return entry
+
+
+def evict(max_bytes: int = MAX_BYTES) -> int:
+    """Delete the least recently used models until they fit in max_bytes.
+
+    The latest model of every configuration of PINNED_STATION_ID is kept.
+
+    Returns:
+        int: The number of models deleted.
+    """
+    pinned = {}
+    for pk, config in (
+        ModelVersion.objects.filter(station_id=PINNED_STATION_ID)
+        .order_by("-version")
+        .values_list("pk", "config_hash")
+    ):
+        pinned.setdefault(config, pk)
+
+    total = ModelVersion.objects.aggregate(total=Sum("size_bytes"))["total"] or 0
+    deleted = 0
+    for entry in ModelVersion.objects.exclude(pk__in=pinned.values()).order_by("last_used").iterator():
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(REGISTRY_DIR, entry.path))
+        except OSError:
+            pass
+        entry.delete()
+        total -= entry.size_bytes
+        deleted += 1
+    return deleted
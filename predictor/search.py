@@ -0,0 +1,214 @@
+import bisect
+import difflib
+import functools
+import json
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from .models import Station
+
+# Seconds a search is answered locally, when it found stations and when not.
+HIT_TTL: float = 7 * 24 * 60 * 60
+MISS_TTL: float = 60 * 60
+
+# Similarity (0 to 1) a misspelled query needs with a known one to reuse it.
+FUZZY_CUTOFF: float = 0.8
+
+# Shortest query that is matched against the start of station names.
+MIN_PREFIX: int = 3
+
+
+def normalize_city(city: str) -> str:
+    """Normalize a city name for lookups.
+
+    Accents are stripped, case is folded and punctuation and repeated
+    whitespace collapse to single spaces, so "São  Paulo" and "sao paulo"
+    are the same key.
+    """
+    text = unicodedata.normalize("NFKD", city)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[\W_]+", " ", text.casefold()).split())
+
+
+def parse_candidates(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convert the results of the station search endpoint into station records.
+
+    Args:
+        candidates (List[Dict[str, Any]]): The "results" of the search response.
+
+    Returns:
+        List[Dict[str, Any]]: One record per station, with the columns of
+            Ozon3.get_city_station_options.
+    """
+    return [
+        {
+            "city_id": candidate["x"],
+            "country_code": candidate["c"],
+            "station_name": candidate["n"],
+            "city_url": candidate["s"].get("u"),
+            "score": candidate["score"],
+        }
+        for candidate in candidates
+    ]
+
+
+class StationIndex:
+    """In-memory index of known stations and of past searches.
+
+    Searches are remembered with an expiry, including the ones that found
+    nothing. Queries the network finds nothing for fall back to fuzzy
+    matching against remembered searches and to prefix matching against the
+    parts of station names.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stations: Dict[int, Dict[str, Any]] = {}
+        # Sorted (normalized part of a station name, city_id) pairs.
+        self._name_parts: List[Tuple[str, int]] = []
+        # Normalized query -> (expiry, city_ids ordered by score).
+        self._queries: Dict[str, Tuple[float, List[int]]] = {}
+
+    def add_stations(self, records: List[Dict[str, Any]]) -> None:
+        """Add station records, replacing the ones already known by city_id."""
+        with self._lock:
+            for record in records:
+                city_id = int(record["city_id"])
+                if city_id not in self._stations:
+                    for part in str(record["station_name"]).split(","):
+                        part = normalize_city(part)
+                        if part:
+                            bisect.insort(self._name_parts, (part, city_id))
+                self._stations[city_id] = record
+
+    def remember(self, query: str, records: List[Dict[str, Any]]) -> None:
+        """Remember the stations a search returned. An empty list is a miss."""
+        self.add_stations(records)
+        ranked = sorted(records, key=lambda r: r["score"], reverse=True)
+        ttl = HIT_TTL if ranked else MISS_TTL
+        with self._lock:
+            self._queries[normalize_city(query)] = (
+                time.monotonic() + ttl,
+                [int(r["city_id"]) for r in ranked],
+            )
+
+    def lookup(self, query: str) -> Optional[List[Dict[str, Any]]]:
+        """Answer a search locally, from a remembered search of the same query.
+
+        Args:
+            query (str): Name of a city.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: The matching station records, best
+                first, an empty list for a remembered miss, or None when the
+                search has to go to the network.
+        """
+        key = normalize_city(query)
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    return [self._stations[i] for i in entry[1]]
+                del self._queries[key]
+        return None
+
+    def similar(self, query: str) -> List[Dict[str, Any]]:
+        """Guess the stations of a query the network search found nothing for.
+
+        A misspelled query reuses the stations of a close remembered one,
+        otherwise station names starting with the query match. Only a
+        fallback: a correctly spelled city could match another one.
+
+        Args:
+            query (str): Name of a city.
+
+        Returns:
+            List[Dict[str, Any]]: The matching station records, best first,
+                empty when nothing is close.
+        """
+        key = normalize_city(query)
+        now = time.monotonic()
+        with self._lock:
+            known = [q for q, (expiry, ids) in self._queries.items() if ids and expiry > now]
+            close = difflib.get_close_matches(key, known, n=1, cutoff=FUZZY_CUTOFF)
+            if close:
+                return [self._stations[i] for i in self._queries[close[0]][1]]
+
+            if len(key) < MIN_PREFIX:
+                return []
+            ids = set()
+            start = bisect.bisect_left(self._name_parts, (key,))
+            for part, city_id in self._name_parts[start:]:
+                if not part.startswith(key):
+                    break
+                ids.add(city_id)
+            records = [self._stations[i] for i in ids]
+        return sorted(records, key=lambda r: r["score"], reverse=True)
+
+
+def _save_stations(records: List[Dict[str, Any]]) -> None:
+    """Persist station records so the index survives restarts."""
+    Station.objects.bulk_create(
+        [
+            Station(
+                station_id=int(r["city_id"]),
+                name=r["station_name"] or "",
+                country_code=r["country_code"] or "",
+                url=r["city_url"] or "",
+                score=r["score"] or 0,
+            )
+            for r in records
+        ],
+        update_conflicts=True,
+        unique_fields=["station_id"],
+        update_fields=["name", "country_code", "url", "score"],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def station_index() -> StationIndex:
+    """Return the process-wide index, filled from the stored stations."""
+    index = StationIndex()
+    index.add_stations(
+        [
+            {
+                "city_id": station.station_id,
+                "country_code": station.country_code,
+                "station_name": station.name,
+                "city_url": station.url,
+                "score": station.score,
+            }
+            for station in Station.objects.exclude(name="")
+        ]
+    )
+    return index
+
+
+def record_search(query: str, records: List[Dict[str, Any]]) -> None:
+    """Remember the result of a network search, locally and in the database."""
+    station_index().remember(query, records)
+    if records:
+        _save_stations(records)
+
+
+def load_dump(path: str) -> int:
+    """Fill the index from a bulk dump of station search results.
+
+    Args:
+        path (str): JSON file holding either a station search response or a
+            list of its "results".
+
+    Returns:
+        int: The number of stations loaded.
+    """
+    with open(path) as f:
+        dump = json.load(f)
+    candidates = dump["results"] if isinstance(dump, dict) else dump
+
+    records = parse_candidates(candidates)
+    station_index().add_stations(records)
+    _save_stations(records)
+    return len(records)
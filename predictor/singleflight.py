@@ -0,0 +1,123 @@
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .jobs import worker_name
+from .models import Flight
+
+# Seconds a request waits for another one to finish the same work.
+TIMEOUT: float = 120
+
+# How long a worker holds a key before others assume it died and take over.
+LEASE: timedelta = timedelta(minutes=5)
+
+# How long the error of failed work is handed to the workers that waited for it.
+ERROR_TTL: timedelta = timedelta(seconds=5)
+
+# Seconds between checks on work done by another worker.
+POLL_INTERVAL: float = 0.2
+
+
+class FlightTimeout(Exception):
+    """Raised when the work for a key did not finish within the timeout."""
+
+
+class FlightError(Exception):
+    """Raised in the workers that waited for work that failed in another one, with its error."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+_calls: Dict[str, _Call] = {}
+_calls_lock = threading.Lock()
+
+
+def do(key: str, fn: Callable[[], Any], timeout: float = TIMEOUT) -> Any:
+    """Run fn once for all concurrent callers with the same key.
+
+    Within a process, the first caller runs fn and the others wait for its
+    result or exception. Across workers, the first one holds the key in the
+    database while the others wait, then run fn themselves. fn should find
+    the result in shared state by then (the station store, the model
+    registry or the forecast cache) and return quickly.
+
+    Args:
+        key (str): Identifies the work, e.g. a station or a forecast cache key.
+        fn (Callable[[], Any]): Does the work.
+        timeout (float, optional): Seconds to wait for the work of another
+            caller. Defaults to TIMEOUT.
+
+    Returns:
+        Any: What fn returned, for this caller or the one it waited for.
+
+    Raises:
+        FlightTimeout: If the work for key took longer than timeout.
+        FlightError: If the work for key failed in another worker.
+    """
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        if not call.done.wait(timeout):
+            raise FlightTimeout(f"Gave up waiting for {key} after {timeout}s.")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _across_workers(key, fn, timeout)
+        return call.result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
+
+
+def _across_workers(key: str, fn: Callable[[], Any], timeout: float) -> Any:
+    """Run fn while holding key in the database, once no other worker holds it."""
+    deadline = time.monotonic() + timeout
+    while not _acquire(key):
+        flight = Flight.objects.filter(key=key).first()
+        if flight is not None and flight.error:
+            raise FlightError(flight.error)
+        if time.monotonic() > deadline:
+            raise FlightTimeout(f"Gave up waiting for {key} after {timeout}s.")
+        time.sleep(POLL_INTERVAL)
+
+    try:
+        result = fn()
+    except Exception as e:
+        # Keep the error briefly for the workers waiting on the key.
+        Flight.objects.filter(key=key).update(
+            error=str(e) or type(e).__name__, expires_at=timezone.now() + ERROR_TTL
+        )
+        raise
+    Flight.objects.filter(key=key).delete()
+    return result
+
+
+def _acquire(key: str) -> bool:
+    """Hold key for this worker, taking it over from a worker whose lease expired."""
+    now = timezone.now()
+    Flight.objects.filter(key=key, expires_at__lt=now).delete()
+    try:
+        with transaction.atomic():
+            Flight.objects.create(key=key, owner=worker_name(), expires_at=now + LEASE)
+        return True
+    except IntegrityError:
+        return False
@@ -0,0 +1,160 @@
+import logging
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+import pandas
+from django.db import transaction
+from django.utils import timezone
+
+from .decodedata import get_data_from_id
+from .models import Observation, Station
+
+logger = logging.getLogger(__name__)
+
+# How long a station's stored history is served before the backend is asked
+# for new days again.
+SYNC_INTERVAL: timedelta = timedelta(hours=6)
+
+
+def sync_station(city_id: int) -> int:
+    """Fetch a station's history from the backend and merge the new days.
+
+    Days from the last stored one onwards are upserted, since the backend
+    keeps updating the current day. Older days are left untouched, and the
+    messages that only hold older days are not decoded into the frame, see
+    get_data_from_id for when the download itself stops early.
+
+    Args:
+        city_id (int): The WAQI city ID of the station.
+
+    Returns:
+        int: The number of observations written.
+    """
+    known = Station.objects.filter(station_id=city_id).values_list("last_date", flat=True).first()
+    frame = get_data_from_id(city_id, since=known)
+    if "pm25" in frame.columns:
+        frame = frame.rename(columns={"pm25": "pm2.5"})
+
+    with transaction.atomic():
+        station, _ = Station.objects.select_for_update().get_or_create(
+            station_id=city_id
+        )
+        if station.last_date is not None and len(frame):
+            frame = frame[frame.index.date >= station.last_date]
+
+        # Long format without the gaps the reindexing filled with nan.
+        long = frame.rename_axis("date").reset_index().melt(
+            id_vars="date", var_name="pollutant", value_name="value"
+        )
+        long = long.dropna(subset=["value"])
+
+        rows = [
+            Observation(
+                station_id=city_id, pollutant=pollutant, date=date.date(), value=value
+            )
+            for date, pollutant, value in long.itertuples(index=False)
+        ]
+        Observation.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["station_id", "pollutant", "date"],
+            update_fields=["value"],
+        )
+
+        for pollutant in frame.columns:
+            if pollutant not in station.pollutants:
+                station.pollutants.append(pollutant)
+        if len(long):
+            last_date = long["date"].max().date()
+            station.last_date = max(filter(None, [station.last_date, last_date]))
+        station.last_synced = timezone.now()
+        station.save()
+
+    return len(rows)
+
+
+def load_station(city_id: int) -> pandas.DataFrame:
+    """Read a station's stored history.
+
+    Args:
+        city_id (int): The WAQI city ID of the station.
+
+    Returns:
+        pandas.DataFrame: Daily readings with one column per pollutant, most
+            recent first, with missing days as nan. Same layout as
+            get_data_from_id.
+    """
+    station = Station.objects.filter(station_id=city_id).first()
+    rows = Observation.objects.filter(station_id=city_id).values_list(
+        "date", "pollutant", "value"
+    )
+    long = pandas.DataFrame.from_records(
+        list(rows), columns=["date", "pollutant", "value"]
+    )
+    if long.empty:
+        return pandas.DataFrame()
+
+    result = long.pivot(index="date", columns="pollutant", values="value")
+    result.index = pandas.DatetimeIndex(result.index)
+    result.columns.name = None
+    if station is not None:
+        result = result[[p for p in station.pollutants if p in result.columns]]
+
+    # Reindex to make missing dates appear with value nan
+    complete_days = pandas.date_range(result.index.min(), result.index.max(), freq="D")
+    result = result.reindex(complete_days)
+
+    # Arrange to make most recent appear on top of DataFrame
+    return result.sort_index(ascending=False)
+
+
+def load_latest(city_id: int) -> Tuple[Optional[date], Dict[str, float]]:
+    """Read the readings of a station's last stored day.
+
+    Args:
+        city_id (int): The WAQI city ID of the station.
+
+    Returns:
+        Tuple[Optional[date], Dict[str, float]]: The day and its readings by
+            pollutant, None and an empty dict for an unknown station.
+    """
+    station = Station.objects.filter(station_id=city_id).first()
+    if station is None or station.last_date is None:
+        return None, {}
+    readings = dict(
+        Observation.objects.filter(station_id=city_id, date=station.last_date).values_list(
+            "pollutant", "value"
+        )
+    )
+    order = [p for p in station.pollutants if p in readings]
+    return station.last_date, {p: readings[p] for p in order + sorted(set(readings) - set(order))}
+
+
+def get_station_history(city_id: int) -> pandas.DataFrame:
+    """Return a station's history, syncing it first when it is stale.
+
+    When the sync fails, the stored history is served as it is. The error
+    is only raised for a station without any stored history.
+
+    Args:
+        city_id (int): The WAQI city ID of the station.
+
+    Returns:
+        pandas.DataFrame: See load_station.
+    """
+    city_id = int(city_id)
+    station = Station.objects.filter(station_id=city_id).first()
+    if (
+        station is None
+        or station.last_synced is None
+        or timezone.now() - station.last_synced > SYNC_INTERVAL
+    ):
+        try:
+            sync_station(city_id)
+        except Exception:
+            history = load_station(city_id)
+            if history.empty:
+                raise
+            logger.warning("Sync of station %s failed, serving its stored history", city_id, exc_info=True)
+            return history
+    return load_station(city_id)
@@ -0,0 +1,92 @@
+from typing import Any, Dict
+from unittest import mock
+
+import numpy
+import pandas
+from django.test import SimpleTestCase
+from pandas.testing import assert_frame_equal
+
+from . import decodedata
+
+
+def _message(ps: Dict[str, str], st: int, period: str = "d") -> Dict[str, Any]:
+    """A backend event with the series ps, in the shape of the event stream."""
+    return {"msg": {"ps": ps, "dh": 24, "st": st, "meta": {"si": {}}, "period": period}}
+
+
+class DecodeMessageTests(SimpleTestCase):
+    """The native decoder reads messages like the js2py reference does.
+
+    The reference gives integer values where all readings are whole numbers,
+    so dtypes are not compared.
+    """
+
+    def assertDecodesLikeReference(self, message: Dict[str, Any]) -> None:
+        reference = decodedata.parse_incoming_result_js(message)
+        # An empty species leaves the reference with an index of objects.
+        reference.index = pandas.DatetimeIndex(reference.index)
+        assert_frame_equal(
+            decodedata.parse_incoming_result(message), reference, check_dtype=False
+        )
+
+    def test_daily(self):
+        # Repeated deltas, skips and scales.
+        self.assertDecodesLikeReference(
+            _message({"pm25": "13AB$C!-12.c", "pm10": "1/2.AB|4.C", "o3": "1*10.AB!-3.C"}, 470000)
+        )
+
+    def test_weekly(self):
+        # Weeks of two chunks that run into the next year.
+        self.assertDecodesLikeReference(
+            _message({"pm25": "2w:2AC/Bb", "pm10": "2w:DD"}, 2023 * 53 + 50, "w")
+        )
+
+    def test_monthly(self):
+        # Months of two chunks that run into the next year.
+        self.assertDecodesLikeReference(
+            _message({"pm25": "2m:3Bc/AB", "o3": "2m:CD"}, 2022 * 12 + 9, "m")
+        )
+
+    def test_unknown_species(self):
+        # Species outside the display order are sorted like the frontend does.
+        message = _message({"uvi": "1AB!-3.C", "pm25": "1ABC", "wind": "1$C%D", "co": "1B"}, 470000)
+        self.assertDecodesLikeReference(message)
+        self.assertEqual(
+            list(decodedata.parse_incoming_result(message).columns),
+            list(decodedata.parse_incoming_result_js(message).columns),
+        )
+
+    def test_unknown_series_type(self):
+        self.assertDecodesLikeReference(_message({"pm25": "1ABC", "pm10": "3ABC"}, 470000))
+
+
+class GetDataFromIdTests(SimpleTestCase):
+    """get_data_from_id folds the streamed messages into a daily frame."""
+
+    # 2023-08-15 00:00 UTC, in hours since the epoch.
+    START = 470016
+
+    def get_data(self, messages, **kwargs) -> pandas.DataFrame:
+        stream = (message for message in messages)
+        with mock.patch.object(decodedata, "iter_backend_messages", return_value=stream):
+            return decodedata.get_data_from_id(900001, **kwargs)
+
+    def test_duplicates_keep_first_received(self):
+        # The second message repeats the last day of the first one.
+        frame = self.get_data(
+            [
+                _message({"pm25": "1BCD"}, self.START),
+                _message({"pm25": "1Z!30."}, self.START + 2 * 24),
+            ]
+        )
+
+        self.assertTrue(frame.index.is_unique)
+        self.assertTrue(frame.index.is_monotonic_decreasing)
+        self.assertEqual(frame.index[0], pandas.Timestamp("2023-08-19"))
+        self.assertEqual(frame["pm25"].tolist(), [55.0, 6.0, 3.0, 1.0])
+
+    def test_missing_days_are_nan(self):
+        frame = self.get_data([_message({"pm25": "1B|3.C"}, self.START)])
+
+        self.assertEqual(len(frame), 4)
+        self.assertTrue(numpy.isnan(frame["pm25"].iloc[1:3]).all())
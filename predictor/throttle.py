@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from django.conf import settings
+
+# Calls per second the WAQI servers allow, see settings.UPSTREAM_RATE. 0
+# disables the limiter.
+RATE: float = getattr(settings, "UPSTREAM_RATE", 1000)
+
+# Seconds of calls that may be made at once after an idle period.
+BURST_SECONDS: float = 1.0
+
+# SQLite file the bucket is kept in, shared by every worker of the host.
+PATH: str = getattr(
+    settings, "UPSTREAM_LIMITER_PATH", os.path.join(tempfile.gettempdir(), "aqi-upstream.sqlite3")
+)
+
+# Seconds a worker waits for another one to release the bucket.
+LOCK_TIMEOUT: float = 10
+
+# A throttled or failed call cuts the rate by this factor, down to MIN_RATE.
+# It then recovers linearly to RATE over RECOVERY_SECONDS.
+BACKOFF_FACTOR: float = 0.5
+MIN_RATE: float = 1.0
+RECOVERY_SECONDS: float = 60.0
+
+# Calls, backoffs and seconds waited by this process, exported at /metrics/.
+_counters: Dict[str, float] = {"calls": 0, "backoffs": 0, "wait_seconds": 0.0}
+_counters_lock = threading.Lock()
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """The connection of this thread, opened again in forked workers."""
+    db = getattr(_local, "db", None)
+    if db is None or _local.pid != os.getpid():
+        db = sqlite3.connect(PATH, timeout=LOCK_TIMEOUT, isolation_level=None)
+        # The bucket is worthless after a crash, so it is never synced to disk.
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS bucket "
+            "(id INTEGER PRIMARY KEY, tokens REAL, rate REAL, updated REAL)"
+        )
+        _local.db, _local.pid = db, os.getpid()
+    return db
+
+
+@contextmanager
+def _bucket() -> Iterator[list]:
+    """Lock the bucket and yield its refilled state, [tokens, rate, now], to update."""
+    db = _connect()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        state = _refill(db.execute("SELECT tokens, rate, updated FROM bucket WHERE id = 1").fetchone())
+        yield state
+        db.execute(
+            "INSERT OR REPLACE INTO bucket (id, tokens, rate, updated) VALUES (1, ?, ?, ?)", state
+        )
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+
+def _refill(row: Optional[Tuple[float, float, float]]) -> list:
+    """Add the tokens and the rate recovered since the bucket was last updated."""
+    now = time.time()
+    if row is None:
+        return [RATE * BURST_SECONDS, RATE, now]
+
+    tokens, rate, updated = row
+    elapsed = max(now - updated, 0.0)
+    rate = min(RATE, rate + elapsed * RATE / RECOVERY_SECONDS)
+    tokens = min(max(rate * BURST_SECONDS, 1.0), tokens + elapsed * rate)
+    return [tokens, rate, now]
+
+
+def acquire() -> float:
+    """Take a token for an upstream call, sleeping until it is due.
+
+    Every caller reserves its token right away and sleeps outside the lock,
+    so the workers of the host are served in order at the current rate.
+
+    Returns:
+        float: The seconds waited.
+    """
+    if RATE <= 0:
+        return 0.0
+
+    with _bucket() as state:
+        state[0] -= 1
+        wait = -state[0] / state[1] if state[0] < 0 else 0.0
+
+    with _counters_lock:
+        _counters["calls"] += 1
+        _counters["wait_seconds"] += wait
+    if wait:
+        time.sleep(wait)
+    return wait
+
+
+def backoff(delay: Optional[float] = None) -> None:
+    """Slow every worker down after upstream throttled or failed a call.
+
+    Args:
+        delay (float, optional): Seconds no call is made for. With the
+            limiter disabled, only the caller waits them, here.
+    """
+    if RATE <= 0:
+        if delay:
+            time.sleep(delay)
+        return
+
+    with _bucket() as state:
+        state[1] = max(MIN_RATE, state[1] * BACKOFF_FACTOR)
+        # The burst is dropped, and calls wait out the delay at the new rate.
+        state[0] = min(state[0], 0.0) - (delay or 0.0) * state[1]
+
+    with _counters_lock:
+        _counters["backoffs"] += 1
+
+
+def status() -> Dict[str, float]:
+    """The limit, the current rate, the tokens left and how long a call would wait now."""
+    if RATE <= 0:
+        return {"limit": 0.0, "rate": 0.0, "tokens": 0.0, "wait": 0.0}
+
+    row = _connect().execute("SELECT tokens, rate, updated FROM bucket WHERE id = 1").fetchone()
+    tokens, rate, _ = _refill(row)
+    return {
+        "limit": float(RATE),
+        "rate": rate,
+        "tokens": tokens,
+        "wait": max(1 - tokens, 0.0) / rate,
+    }
+
+
+def prometheus_text() -> str:
+    """Export the limiter state and the counters of this process in the Prometheus text format."""
+    current = status()
+    with _counters_lock:
+        counters = dict(_counters)
+
+    lines = []
+    for name, help_text, kind, value in [
+        ("aqi_upstream_rate_limit", "Upstream calls per second allowed.", "gauge", current["limit"]),
+        ("aqi_upstream_rate", "Upstream calls per second after backoff.", "gauge", current["rate"]),
+        ("aqi_upstream_tokens", "Upstream calls that can be made without waiting.", "gauge", current["tokens"]),
+        ("aqi_upstream_calls_total", "Upstream calls made by this process.", "counter", counters["calls"]),
+        ("aqi_upstream_backoffs_total", "Throttled or failed upstream calls.", "counter", counters["backoffs"]),
+        ("aqi_upstream_wait_seconds_total", "Time spent waiting for the limiter.", "counter", counters["wait_seconds"]),
+    ]:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
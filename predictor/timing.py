@@ -0,0 +1,156 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+# Whether stages are timed at all. When off, stage() hands out a shared no-op
+# context manager and nothing is recorded.
+ENABLED: bool = getattr(settings, "STAGE_TIMING", True)
+
+# Upper bounds in seconds of the histogram buckets.
+BUCKETS: Tuple[float, ...] = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+)
+
+# Name of the exported Prometheus metric.
+METRIC: str = "aqi_stage_duration_seconds"
+
+# (stage, seconds) recorded during the current request, None outside requests.
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = (
+    contextvars.ContextVar("request_timings", default=None)
+)
+
+_NOOP = contextlib.nullcontext()
+
+
+class Histogram:
+    """Thread-safe cumulative histogram of durations, as Prometheus exposes them."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """Return the cumulative bucket counts, the sum and the count."""
+        with self._lock:
+            cumulative, total = [], 0
+            for count in self.counts:
+                total += count
+                cumulative.append(total)
+            return cumulative, self.sum, self.count
+
+
+_histograms: Dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def _histogram(name: str) -> Histogram:
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, Histogram())
+    return histogram
+
+
+def record(name: str, seconds: float) -> None:
+    """Record a stage duration, for the current request and the histograms."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+    _histogram(name).observe(seconds)
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+
+
+def stage(name: str):
+    """Context manager timing a stage of the forecast pipeline.
+
+    Durations of a stage entered several times within a request add up. Stages
+    run in pool threads are only aggregated into the histograms, and stages
+    run in worker processes are not seen by the serving process.
+
+    Example:
+        with timing.stage("fit"):
+            forecaster.fit(y)
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Stage(name)
+
+
+def server_timing(timings: List[Tuple[str, float]]) -> str:
+    """Format timings as a Server-Timing header, in milliseconds."""
+    totals: Dict[str, float] = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1e3:.1f}" for name, seconds in totals.items())
+
+
+def prometheus_text() -> str:
+    """Export the stage histograms in the Prometheus text format."""
+    lines = [
+        f"# HELP {METRIC} Time spent in each stage of serving a forecast.",
+        f"# TYPE {METRIC} histogram",
+    ]
+    with _histograms_lock:
+        histograms = sorted(_histograms.items())
+    for name, histogram in histograms:
+        cumulative, total, count = histogram.snapshot()
+        bounds = [repr(float(b)) for b in histogram.buckets] + ["+Inf"]
+        for bound, value in zip(bounds, cumulative):
+            lines.append(f'{METRIC}_bucket{{stage="{name}",le="{bound}"}} {value}')
+        lines.append(f'{METRIC}_sum{{stage="{name}"}} {total}')
+        lines.append(f'{METRIC}_count{{stage="{name}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+class ServerTimingMiddleware:
+    """Collect the stages of every request into a Server-Timing header.
+
+    The whole request is recorded as the "request" stage.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not ENABLED:
+            return self.get_response(request)
+
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timings.reset(token)
+        seconds = time.perf_counter() - start
+        record("request", seconds)
+
+        timings.append(("request", seconds))
+        response["Server-Timing"] = server_timing(timings)
+        return response
@@ -18,5 +18,12 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('', views.getAQI)
+    path('', views.getAQI),
+    path('batch/', views.getBatchAQI),
+    path('current/', views.currentAQI),
+    path('stations/', views.nearbyStations),
+    path('jobs/', views.submitForecastJob),
+    path('jobs/<uuid:job_id>/', views.forecastJobStatus),
+    path('jobs/<uuid:job_id>/result/', views.forecastJobResult),
+    path('metrics/', views.metrics),
 ]
@@ -1,27 +1,219 @@
-from django.shortcuts import render
-from . import data, forecaster
-from django.http import JsonResponse
+from django.conf import settings
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import render, get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+import functools
+import hmac
+import json
+from . import encoding, jobs, multicity, precompute, singleflight, throttle, timing
+from .models import ForecastJob
+from django.http import HttpResponse, JsonResponse
+
+# data and forecaster pull in pandas, sktime and Prophet. They are imported by
+# the views that forecast, so rendering the page stays cheap in a freshly
+# started process.
 
 # Create your views here.
 def getAQI(request):
     if(request.method == 'POST'):
         searchKey = request.POST.get("searchKey")
-        #get the historical data of the city
-        hist = data.getCityData(city_name=searchKey)
-        #get the predictions 
-        predictions = forecaster.getForecastData(data=hist)
+        #lat and lon skip the name search, the nearest station is used
+        try:
+            lat, lon = _location(request)
+        except ValueError:
+            return JsonResponse({'code' : 400}, status=400)
+        #mode=current answers with today's readings only, without forecasting
+        if _param(request, "mode") == "current":
+            return JsonResponse(_currentData(searchKey, lat, lon))
+        from . import data, forecaster
+        #format=columnar: dates once and an array per pollutant, intervals=1 adds the bounds
+        columnar = _param(request, "format") == "columnar"
+        try:
+            if lat is None:
+                #count the request, popular cities get precomputed
+                precompute.record_request(searchKey)
+                #get the historical data of the city
+                hist = data.getCityData(city_name=searchKey)
+            else:
+                hist = data.getCityData(lat=lat, lon=lon)
+            #get the predictions 
+            predictions = forecaster.getForecastData(data=hist, columnar=columnar, intervals=_param(request, "intervals") == "1")
+        except (singleflight.FlightError, singleflight.FlightTimeout):
+            #another worker failed or is still busy with the same city, try again later
+            return JsonResponse({'code' : 503}, status=503)
 
-        return JsonResponse(predictions)
+        with timing.stage("encode"):
+            if columnar:
+                response = encoding.json_response(request, predictions)
+            else:
+                response = JsonResponse(predictions)
+        return response
     return render(request, 'index.html')
 
 
+def api_view(view):
+    #scripts and dashboards send an X-API-Key from settings.API_KEYS, pages of the site their CSRF token
+    @functools.wraps(view)
+    @csrf_exempt
+    def wrapped(request, *args, **kwargs):
+        if not _valid_api_key(request):
+            rejected = CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
+            if rejected is not None:
+                return JsonResponse({'code' : 403}, status=403)
+        return view(request, *args, **kwargs)
+    return wrapped
+
+
+def _valid_api_key(request):
+    key = request.headers.get("X-API-Key", "")
+    return bool(key) and any(hmac.compare_digest(key, valid) for valid in getattr(settings, "API_KEYS", []))
+
+
+def _param(request, name):
+    #from the form or the query string
+    return request.POST.get(name) or request.GET.get(name)
+
+
+def _location(request):
+    #(lat, lon) from the parameters, (None, None) without them
+    lat, lon = _param(request, "lat"), _param(request, "lon")
+    if lat is None and lon is None:
+        return None, None
+    if lat is None or lon is None:
+        raise ValueError("lat and lon go together")
+    lat, lon = float(lat), float(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"No such position {lat}, {lon}")
+    return lat, lon
+
+
+def currentAQI(request):
+    #?searchKey=, ?city_id= or ?lat=&lon=, answered from the feed or the store in milliseconds
+    try:
+        lat, lon = _location(request)
+        city_id = _param(request, "city_id")
+        city_id = int(city_id) if city_id else None
+    except ValueError:
+        return JsonResponse({'code' : 400}, status=400)
+    searchKey = _param(request, "searchKey")
+    if lat is None and city_id is None and not searchKey:
+        return JsonResponse({'code' : 400}, status=400)
+
+    return JsonResponse(_currentData(searchKey, lat, lon, city_id))
+
+
+def _currentData(searchKey, lat, lon, city_id=None):
+    from . import data
+    current = data.getCurrentData(city_name=searchKey, city_id=city_id, lat=lat, lon=lon)
+    return {'code' : 404} if current == 404 else current
+
+
 def demo(request):
     if request.method == 'POST':
+        from . import data, forecaster
         searchKey = request.POST.get("searchKey")
-        #get the historical data of the city
-        hist = data.getCityData(city_name=searchKey)
-        #get the predictions 
-        predictions = forecaster.getForecastData(data=hist)
+        try:
+            #get the historical data of the city
+            hist = data.getCityData(city_name=searchKey)
+            #get the predictions 
+            predictions = forecaster.getForecastData(data=hist)
+        except (singleflight.FlightError, singleflight.FlightTimeout):
+            return JsonResponse({'code' : 503}, status=503)
+
+        with timing.stage("encode"):
+            response = JsonResponse(predictions)
+        return response
+
+
+@require_POST
+@api_view
+def getBatchAQI(request):
+    #body: {"cities": [...], "station_ids": [...], "format": "columnar", "intervals": true}
+    try:
+        body = json.loads(request.body)
+        cities = [str(city) for city in body.get("cities", [])]
+        station_ids = [int(city_id) for city_id in body.get("station_ids", [])]
+        columnar = body.get("format") == "columnar"
+        intervals = bool(body.get("intervals"))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'code' : 400}, status=400)
+
+    count = len(cities) + len(station_ids)
+    if count == 0 or count > multicity.MAX_CITIES:
+        return JsonResponse({'code' : 400}, status=400)
+
+    #get the predictions of every city, concurrently
+    predictions = multicity.forecast_many(cities=cities, station_ids=station_ids, columnar=columnar, intervals=intervals)
+
+    with timing.stage("encode"):
+        if columnar:
+            response = encoding.json_response(request, {'code' : 200, 'response' : predictions})
+        else:
+            response = JsonResponse({'code' : 200, 'response' : predictions})
+    return response
+
+
+@require_GET
+def nearbyStations(request):
+    #?lat=&lon=&k= for the nearest stations, ?bbox=south,west,north,east for those inside a box
+    from . import geo
+    index = geo.geo_index()
+    try:
+        bbox = _param(request, "bbox")
+        if bbox:
+            south, west, north, east = [float(value) for value in bbox.split(",")]
+            stations = [{'city_id' : city_id} for city_id in index.within(south, west, north, east)]
+        else:
+            lat, lon = _location(request)
+            if lat is None:
+                raise ValueError("lat and lon are required")
+            k = min(int(_param(request, "k") or 1), geo.MAX_NEARBY)
+            stations = [{'city_id' : city_id, 'distance_km' : round(km, 3)} for city_id, km in index.nearest(lat, lon, k=k)]
+    except ValueError:
+        return JsonResponse({'code' : 400}, status=400)
+
+    return JsonResponse({'code' : 200, 'response' : stations})
+
+
+@require_POST
+@api_view
+def submitForecastJob(request):
+    searchKey = request.POST.get("searchKey")
+    if not searchKey:
+        return JsonResponse({'code' : 400}, status=400)
+    precompute.record_request(searchKey)
+    #queue the forecast, a worker process runs it
+    job = jobs.submit(searchKey)
+
+    return JsonResponse({'code' : 202, 'job_id' : str(job.id)}, status=202)
+
+
+#no api_view on the job GETs, its CSRF check skips safe methods. The random
+#UUID only submitForecastJob hands out is what grants access to a job
+@require_GET
+def forecastJobStatus(request, job_id):
+    job = get_object_or_404(ForecastJob, pk=job_id)
+
+    return JsonResponse({'code' : 200, 'response' : jobs.status(job)})
+
+
+@require_GET
+def forecastJobResult(request, job_id):
+    #access by job ID, see forecastJobStatus
+    job = get_object_or_404(ForecastJob, pk=job_id)
+    if job.status != ForecastJob.DONE:
+        #not ready yet, or failed
+        code = 500 if job.status == ForecastJob.FAILED else 202
+        return JsonResponse({'code' : code, 'response' : jobs.status(job)})
+
+    #same payload as getAQI
+    with timing.stage("encode"):
+        response = JsonResponse(job.result)
+    return response
+
 
-        return JsonResponse(predictions)
-    
+@require_GET
+def metrics(request):
+    #stage durations of this process and the upstream rate limiter, for Prometheus to scrape
+    return HttpResponse(timing.prometheus_text() + throttle.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,101 @@
+from typing import Any, Dict, Iterable, Optional
+
+import numpy
+from django.db.models import Avg
+from prophet import Prophet as _Prophet
+
+from .models import ProphetFit
+
+
+class WarmProphet(_Prophet):
+    """Prophet model whose fits start from given parameters.
+
+    Args:
+        init (dict, optional): Starting values of k, m, sigma_obs, delta and
+            beta. Prophet falls back to its own start for any parameter whose
+            shape no longer matches.
+        **kwargs: Passed on to prophet.Prophet.
+    """
+
+    def __init__(self, init=None, **kwargs):
+        super().__init__(**kwargs)
+        self.init = init
+
+    def fit(self, df, **kwargs):
+        if self.init is not None:
+            kwargs.setdefault("init", self.init)
+        return super().fit(df, **kwargs)
+
+
+def extract_params(model: _Prophet) -> Dict[str, Any]:
+    """Return the fitted MAP parameters of a Prophet model as plain lists and floats."""
+    params = {name: float(model.params[name][0][0]) for name in ["k", "m", "sigma_obs"]}
+    for name in ["delta", "beta"]:
+        params[name] = model.params[name][0].tolist()
+    return params
+
+
+def load_inits(station_id: int, pollutants: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Return the stored parameters of a station, ready to be used as init.
+
+    Args:
+        station_id (int): The WAQI city ID of the station.
+        pollutants (Iterable[str]): The pollutants to look up.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Starting values by pollutant, for the
+            pollutants fitted before.
+    """
+    inits = {}
+    for fit in ProphetFit.objects.filter(station_id=station_id, pollutant__in=list(pollutants)):
+        init = dict(fit.params)
+        for name in ["delta", "beta"]:
+            init[name] = numpy.asarray(init[name])
+        inits[fit.pollutant] = init
+    return inits
+
+
+def save_fit(
+    station_id: int, pollutant: str, params: Dict[str, Any], seconds: float, warm: bool
+) -> None:
+    """Store the parameters and duration of a fit.
+
+    Args:
+        station_id (int): The WAQI city ID of the station.
+        pollutant (str): The fitted column.
+        params (Dict[str, Any]): See extract_params.
+        seconds (float): How long the fit took.
+        warm (bool): Whether the fit started from stored parameters.
+    """
+    duration = {"warm_seconds" if warm else "cold_seconds": seconds}
+    ProphetFit.objects.update_or_create(
+        station_id=station_id,
+        pollutant=pollutant,
+        defaults={"params": params, **duration},
+    )
+
+
+def convergence_report(station_id: Optional[int] = None) -> Dict[str, Any]:
+    """Compare how long cold and warm started fits take.
+
+    Args:
+        station_id (int, optional): Restrict the report to one station.
+
+    Returns:
+        Dict[str, Any]: Mean cold and warm fit seconds over the fits that have
+            both, and the resulting speedup.
+    """
+    fits = ProphetFit.objects.filter(cold_seconds__isnull=False, warm_seconds__isnull=False)
+    if station_id is not None:
+        fits = fits.filter(station_id=station_id)
+    means = fits.aggregate(cold=Avg("cold_seconds"), warm=Avg("warm_seconds"))
+
+    speedup = None
+    if means["cold"] and means["warm"]:
+        speedup = means["cold"] / means["warm"]
+    return {
+        "fits": fits.count(),
+        "cold_seconds": means["cold"],
+        "warm_seconds": means["warm"],
+        "speedup": speedup,
+    }